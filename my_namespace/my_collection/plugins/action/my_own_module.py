@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import base64
+import functools
+import hashlib
+import mmap
+import os
+from collections import OrderedDict
+
+from ansible.errors import AnsibleActionFail, AnsibleError
+from ansible.module_utils.ansible_release import __version__ as ansible_version
+from ansible.module_utils._text import to_bytes, to_native, to_text
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.delta import (
+    DEFAULT_MAX_LITERAL_RATIO, compute_delta)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.my_utils import (
+    calculate_checksum, compress_content, file_checksum)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.worker import (
+    call, default_socket_path)
+
+MODULE_NAME = 'my_namespace.my_collection.my_own_module'
+DEFAULT_COMPRESSION_THRESHOLD = 64 * 1024
+# Сколько символов content суммарно помнит кеш сведений о содержимом
+PAYLOAD_CACHE_CHARS = 64 * 1024 * 1024
+# Ключи элементов files, содержимое которых передаётся один раз на вызов модуля
+PAYLOAD_KEYS = ('content', 'content_base64', '_content_compressed')
+# Ключи, которыми элемент files задаёт собственное содержимое
+SOURCE_KEYS = ('content', 'content_base64', 'src', 'ensure_lines')
+# Псевдокодировка для content_base64: байты получаются декодированием base64
+BASE64 = 'base64'
+
+
+@functools.lru_cache(maxsize=None)
+def worker_version():
+    """Версия кода модуля: сумма его исходников и версия ansible-core.
+
+    Обработчик на хосте выполняет задачи только той версии, с которой запущен,
+    поэтому после обновления коллекции он заменяется новым.
+    """
+    plugins_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    hasher = hashlib.sha1(ansible_version.encode())
+    sources = [os.path.join(plugins_dir, 'modules', 'my_own_module.py')]
+    utils_dir = os.path.join(plugins_dir, 'module_utils')
+    sources += sorted(os.path.join(utils_dir, name) for name in os.listdir(utils_dir)
+                      if name.endswith('.py'))
+    for source in sources:
+        with open(source, 'rb') as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()
+
+
+class PayloadCache:
+    """Ограниченный LRU-кеш сведений о content на контроллере.
+
+    Ключ — сама строка: её hash() вычисляется один раз и хранится в объекте,
+    а совпадение подтверждается сравнением строк, поэтому чужая сумма не
+    может быть выдана из-за коллизии. Объём ограничен суммарной длиной строк.
+    """
+
+    def __init__(self, max_chars=PAYLOAD_CACHE_CHARS):
+        self.max_chars = max_chars
+        self.chars = 0
+        self.entries = OrderedDict()
+
+    def entry(self, content, encoding='utf-8'):
+        """Возвращает словарь сведений о content в кодировке encoding.
+
+        Для нового содержимого словарь пустой.
+        """
+        # Шаблон может дать число, модуль всё равно получит content строкой
+        content = to_text(content, errors='surrogate_or_strict')
+        key = (content, encoding)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+        entry = {}
+        if len(content) <= self.max_chars:
+            self.entries[key] = entry
+            self.chars += len(content)
+            while self.chars > self.max_chars:
+                (evicted, _), _ = self.entries.popitem(last=False)
+                self.chars -= len(evicted)
+        return entry
+
+
+# Общий для задач процесса: циклы и пакеты с одинаковым content хешируются один раз
+PAYLOADS = PayloadCache()
+
+
+def payload_bytes(content, encoding='utf-8'):
+    """Возвращает байты содержимого: content в encoding или декодированный base64."""
+    if encoding == BASE64:
+        return base64.b64decode(to_bytes(content), validate=True)
+    return to_bytes(content, encoding=encoding, errors='surrogate_or_strict')
+
+
+def content_fingerprint(content, algorithm='sha1', encoding='utf-8'):
+    """Возвращает контрольную сумму и размер содержимого в байтах."""
+    entry = PAYLOADS.entry(content, encoding)
+    if algorithm not in entry:
+        data = payload_bytes(content, encoding)
+        entry[algorithm] = calculate_checksum(data, algorithm)
+        entry['size'] = len(data)
+    return entry[algorithm], entry['size']
+
+
+def merge_timings(first, second):
+    """Складывает замеры timings двух вызовов модуля одной задачи."""
+    if not first or not second:
+        return second or first
+    phases = dict((name, dict(totals)) for name, totals in first['phases'].items())
+    for name, totals in second['phases'].items():
+        merged = phases.setdefault(name, dict(seconds=0.0, calls=0, bytes=0))
+        for key in ('seconds', 'calls', 'bytes'):
+            merged[key] += totals[key]
+    return dict(total=round(first['total'] + second['total'], 6), phases=phases)
+
+
+def compressed_content(content, method, encoding='utf-8'):
+    """Возвращает байты содержимого, сжатые методом method, в base64."""
+    entry = PAYLOADS.entry(content, encoding)
+    key = f"compressed-{method}"
+    if key not in entry:
+        entry[key] = compress_content(payload_bytes(content, encoding), method)
+    return entry[key]
+
+
+class ActionModule(ActionBase):
+    """Передаёт содержимое файла на хост, только если оно там отличается.
+
+    Первый вызов модуля получает лишь контрольную сумму и размер content
+    или файла src с контроллера. Модуль сам применяет изменения прав и
+    владельца, а для файлов с другим содержимым возвращает content_required.
+    Для них модуль вызывается повторно: с content или с путём к файлу src,
+    переданному на хост соединением во временный каталог. Если модуль
+    вернул суммы блоков файла (delta: true), вместо содержимого
+    передаётся дельта. При remote_src: true файл src уже на хосте, и модуль
+    вызывается один раз с исходными аргументами.
+
+    С worker: true модуль передаёт задачи постоянному обработчику на хосте.
+    При локальном соединении без become плагин обращается к обработчику
+    напрямую, не запуская модуль вовсе.
+    """
+
+    _supports_check_mode = True
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        args = self._task.args
+        files = args.get('files')
+        self._algorithm = args.get('checksum_algorithm', 'sha1')
+        self._encoding = args.get('encoding') or 'utf-8'
+        self._remote_src = boolean(args.get('remote_src', False), strict=False)
+        self._state = args.get('state') or 'present'
+        self._sources = {}
+        self._compression = args.get('content_compression', 'auto')
+        self._compression_threshold = args.get('content_compression_threshold',
+                                               DEFAULT_COMPRESSION_THRESHOLD)
+        self._worker = bool(args.get('worker'))
+        self._worker_direct = (self._worker and self._connection.transport == 'local'
+                               and not self._play_context.become)
+
+        try:
+            if args.get('state') == 'verify':
+                result.update(self._run_verify(args, files, task_vars))
+            elif files is None:
+                result.update(self._run_single(args, task_vars))
+            else:
+                result.update(self._run_batch(args, files, task_vars))
+        except (AnsibleError, LookupError, OSError, ValueError) as e:
+            raise AnsibleActionFail(to_native(e))
+        finally:
+            self._remove_tmp_path(self._connection._shell.tmpdir)
+
+        return result
+
+    def _run_module(self, module_args, task_vars):
+        """Выполняет модуль, по возможности через постоянный обработчик."""
+        if self._worker:
+            module_args = dict(module_args, _worker_version=worker_version())
+        if self._worker_direct:
+            socket_path = os.path.expanduser(module_args.get('worker_socket')
+                                             or default_socket_path())
+            try:
+                return call(socket_path, module_args['_worker_version'], module_args,
+                            self._play_context.check_mode)
+            except (OSError, ValueError):
+                # Обработчика нет: модуль выполнит задачу сам и запустит его
+                self._worker_direct = False
+        return self._execute_module(MODULE_NAME, module_args=module_args, task_vars=task_vars)
+
+    def _run_single(self, args, task_vars):
+        if (args.get('state', 'present') != 'present' or args.get('manifest') is not None
+                or self._is_remote(args) or self._edits_in_place(args)):
+            # Удаление, манифест, копирование на хосте и дописывание не требуют
+            # предварительной проверки по контрольной сумме
+            return self._run_module(module_args=args, task_vars=task_vars)
+
+        probe_args = self._fingerprint(args, '')
+        probe = self._run_module(module_args=probe_args, task_vars=task_vars)
+        if probe.get('failed') or not probe.pop('content_required', False):
+            return probe
+
+        update_args = self._with_payload(args, 'source', probe.get('delta_signatures'))
+        result = self._run_module(module_args=update_args, task_vars=task_vars)
+        if 'timings' in probe:
+            result['timings'] = merge_timings(probe['timings'], result.get('timings'))
+        return result
+
+    def _run_verify(self, args, files, task_vars):
+        """Проверка: на хост передаются только контрольные суммы content и src."""
+        verify_args = self._fingerprint(args)
+        if files is not None:
+            verify_args['files'] = [self._fingerprint(item) for item in files]
+        return self._run_module(module_args=verify_args, task_vars=task_vars)
+
+    def _run_batch(self, args, files, task_vars):
+        if any(self._edits_inherited(item) for item in files):
+            # Элемент дописывает унаследованное содержимое: модулю нужно оно само
+            probe_args = dict(args)
+        else:
+            probe_args = self._fingerprint(args)
+        probe_args['files'] = [self._fingerprint(item) for item in files]
+
+        probe = self._run_module(module_args=probe_args, task_vars=task_vars)
+        if not probe.pop('content_required', False):
+            return probe
+
+        # Повторяем вызов только для файлов, которым нужно содержимое
+        results = probe['results']
+        pending = [i for i, r in enumerate(results) if r.get('content_required')]
+
+        update_args = self._with_payload(args, 'source')
+        update_args['files'] = [self._with_payload(files[i], f'source-{i}',
+                                                   results[i].get('delta_signatures'))
+                                for i in pending]
+        update_args = self._share_payloads(update_args)
+        update = self._run_module(module_args=update_args, task_vars=task_vars)
+        if 'timings' in probe:
+            update['timings'] = merge_timings(probe['timings'], update.get('timings'))
+
+        if 'results' not in update:
+            return update
+        for i, item_result in zip(pending, update['results']):
+            results[i] = item_result
+
+        if 'timings' in update:
+            probe['timings'] = update['timings']
+        if update.get('warnings'):
+            probe['warnings'] = probe.get('warnings', []) + update['warnings']
+        probe['changed'] = any(r['changed'] for r in results)
+        failed = [r['path'] for r in results if r.get('failed')]
+        if failed:
+            probe['failed'] = True
+            probe['msg'] = f"Ошибка при обработке файлов: {', '.join(failed)}"
+        else:
+            probe.pop('failed', None)
+            probe.pop('msg', None)
+        return probe
+
+    def _source_fingerprint(self, src):
+        """Находит src на контроллере и возвращает путь, сумму и размер файла."""
+        if src not in self._sources:
+            local_path = self._find_needle('files', src)
+            self._sources[src] = (local_path, file_checksum(local_path, self._algorithm),
+                                  os.path.getsize(local_path))
+        return self._sources[src]
+
+    def _is_remote(self, args):
+        """Проверяет, что src в аргументах — файл на управляемом хосте."""
+        if args.get('src') is None:
+            return False
+        if args.get('remote_src') is None:
+            return self._remote_src
+        return boolean(args['remote_src'], strict=False)
+
+    def _edits_in_place(self, args):
+        """Проверяет, что файл дописывается и модулю нужно само содержимое, а не его сумма."""
+        return ((args.get('state') or self._state) == 'appended'
+                or args.get('ensure_lines') is not None)
+
+    def _edits_inherited(self, item):
+        """Проверяет, что элемент files дописывает содержимое верхнего уровня."""
+        return (self._edits_in_place(item)
+                and all(item.get(key) is None for key in SOURCE_KEYS))
+
+    def _content(self, args):
+        """Возвращает содержимое аргументов и его кодировку (None, если его нет)."""
+        if args.get('content_base64') is not None:
+            return args['content_base64'], BASE64
+        return args.get('content'), args.get('encoding') or self._encoding
+
+    def _fingerprint(self, args, default_content=None):
+        """Заменяет content, content_base64 или src в аргументах на контрольную сумму и размер."""
+        if self._is_remote(args) or self._edits_in_place(args):
+            # Модуль сам хеширует src на хосте или сверяет дописываемые данные с файлом
+            return dict(args)
+        content, encoding = self._content(args)
+        args = dict(args)
+        src = args.pop('src', None)
+        args.pop('content', None)
+        args.pop('content_base64', None)
+        if src is not None:
+            local_path, checksum, size = self._source_fingerprint(src)
+        else:
+            if content is None:
+                content = default_content
+            if content is None:
+                return args
+            checksum, size = content_fingerprint(content, self._algorithm, encoding)
+        args['_content_checksum'], args['_content_size'] = checksum, size
+        return args
+
+    def _compress(self, args):
+        """Добавляет к содержимому его сумму и размер, большое содержимое заменяет сжатым.
+
+        Сумма передаётся всегда, чтобы модуль не вычислял её заново.
+        """
+        content, encoding = self._content(args)
+        if content is None:
+            return args
+        args = dict(args)
+        checksum, size = content_fingerprint(content, self._algorithm, encoding)
+        args['_content_checksum'], args['_content_size'] = checksum, size
+        if self._compression == 'none':
+            return args
+        if self._compression == 'auto' and size < self._compression_threshold:
+            return args
+
+        method = 'zlib' if self._compression == 'auto' else self._compression
+        payload = compressed_content(content, method, encoding)
+        if self._compression == 'auto' and len(payload) >= size:
+            # Несжимаемые данные выгоднее передать как есть
+            return args
+
+        args.pop('content', None)
+        args.pop('content_base64', None)
+        args['_content_compressed'] = payload
+        args['_content_encoding'] = method
+        return args
+
+    def _share_payloads(self, args):
+        """Выносит содержимое, повторяющееся в элементах files, в общий список _payloads.
+
+        Элемент ссылается на содержимое по индексу в _payloads, поэтому
+        одинаковые данные сериализуются в аргументах модуля один раз.
+        """
+        counts = {}
+        for item in args['files']:
+            for key in PAYLOAD_KEYS:
+                if item.get(key):
+                    counts[(key, item[key])] = counts.get((key, item[key]), 0) + 1
+        shared = [payload for payload, count in counts.items() if count > 1]
+        if not shared:
+            return args
+
+        index = dict((payload, i) for i, payload in enumerate(shared))
+        files = []
+        for item in args['files']:
+            for key in PAYLOAD_KEYS:
+                ref = index.get((key, item.get(key)))
+                if ref is not None:
+                    item = dict(item)
+                    del item[key]
+                    item['_payload'] = ref
+            files.append(item)
+        return dict(args, files=files, _payloads=[{key: value} for key, value in shared])
+
+    def _delta(self, args, signatures):
+        """Заменяет content или src в аргументах дельтой к файлу на хосте.
+
+        Возвращает None, если новых данных слишком много и дельта невыгодна.
+        """
+        src = args.get('src')
+        if src is not None:
+            local_path, checksum, size = self._source_fingerprint(src)
+            if size == 0:
+                return None
+            with open(local_path, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                ops = compute_delta(source, signatures, size * DEFAULT_MAX_LITERAL_RATIO)
+        else:
+            content, encoding = self._content(args)
+            content = content or ''
+            source = payload_bytes(content, encoding)
+            checksum, size = content_fingerprint(content, self._algorithm, encoding)
+            ops = compute_delta(source, signatures, size * DEFAULT_MAX_LITERAL_RATIO)
+        if ops is None:
+            return None
+
+        args = dict(args)
+        args.pop('src', None)
+        args.pop('content', None)
+        args.pop('content_base64', None)
+        args['_delta_ops'] = ops
+        args['_delta_block_size'] = signatures['block_size']
+        args['_content_checksum'], args['_content_size'] = checksum, size
+        return args
+
+    def _with_payload(self, args, name, signatures=None):
+        """Подставляет в аргументы содержимое для повторного вызова модуля.
+
+        content передаётся как есть или сжатым. Файл src передаётся методом
+        put_file соединения, то есть потоково, без загрузки в память и без
+        кодирования в аргументы модуля. Контрольная сумма передаётся вместе
+        с содержимым, и модуль сверяет её при записи. При наличии сумм блоков
+        файла на хосте передаётся только дельта.
+        """
+        if self._is_remote(args) or self._edits_in_place(args):
+            return dict(args)
+        if signatures is not None:
+            delta_args = self._delta(args, signatures)
+            if delta_args is not None:
+                return delta_args
+        src = args.get('src')
+        if src is None:
+            return self._compress(args)
+        local_path, checksum, size = self._source_fingerprint(src)
+
+        if self._connection._shell.tmpdir is None:
+            self._make_tmp_path()
+        tmpdir = self._connection._shell.tmpdir
+        remote_path = self._connection._shell.join_path(tmpdir, name)
+        self._transfer_file(local_path, remote_path)
+        self._fixup_perms2((tmpdir, remote_path))
+
+        args = dict(args)
+        args['src'] = remote_path
+        args['_content_checksum'], args['_content_size'] = checksum, size
+        return args
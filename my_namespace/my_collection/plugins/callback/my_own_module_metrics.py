@@ -0,0 +1,326 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+name: my_own_module_metrics
+type: aggregate
+short_description: Сводка производительности задач my_own_module за запуск
+description:
+  - Собирает результаты всех задач M(my_namespace.my_collection.my_own_module),
+    включая элементы O(files), циклы C(loop) и манифесты
+  - Считает изменённые и неизменённые файлы, записанные байты и байты,
+    которые не пришлось записывать, потому что файл уже был нужным
+  - Время задачи измеряется на контроллере, для циклов — каждого элемента;
+    если задача запущена с C(profile=true), учитываются и её замеры по фазам C(timings)
+  - В конце запуска выводит процентили времени по хостам и по путям,
+    а также пишет метрики в формате Prometheus textfile и/или JSON Lines
+requirements:
+  - включение в C(callbacks_enabled) в ansible.cfg или через C(ANSIBLE_CALLBACKS_ENABLED)
+options:
+  prometheus_file:
+    description:
+      - Файл для node_exporter textfile collector, перезаписывается атомарно в конце запуска
+      - Метрики только по хостам и фазам, без путей, чтобы не раздувать число рядов
+    type: path
+    env:
+      - name: MY_OWN_MODULE_METRICS_PROMETHEUS
+    ini:
+      - section: callback_my_own_module_metrics
+        key: prometheus_file
+  jsonl_file:
+    description:
+      - Файл, в который дописывается по одной JSON-строке на каждый вызов модуля
+        (на каждый элемент цикла)
+    type: path
+    env:
+      - name: MY_OWN_MODULE_METRICS_JSONL
+    ini:
+      - section: callback_my_own_module_metrics
+        key: jsonl_file
+  top_paths:
+    description:
+      - Сколько самых медленных путей показать в сводке
+    type: int
+    default: 10
+    env:
+      - name: MY_OWN_MODULE_METRICS_TOP_PATHS
+    ini:
+      - section: callback_my_own_module_metrics
+        key: top_paths
+'''
+
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from ansible.plugins.callback import CallbackBase
+
+MODULE_ACTIONS = frozenset(('my_own_module', 'my_namespace.my_collection.my_own_module'))
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentile(values, fraction):
+    """Процентиль отсортированного списка с линейной интерполяцией."""
+    if not values:
+        return 0.0
+    pos = (len(values) - 1) * fraction
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def file_records(result, failed=False):
+    """Возвращает записи по файлам из результата одного вызова модуля.
+
+    Запись — словарь path, changed, failed, size (None, если неизвестен или
+    файл удалялся), written (записанные байты, если модуль их сообщил,
+    например при дописывании) и count: для манифеста неизменённые файлы
+    сводятся в одну запись. state в результате не подходит: AnsibleModule заменяет его
+    типом файла на диске. failed — признак ошибки всего вызова.
+    """
+    if 'summary' in result:
+        summary = result['summary']
+        records = [dict(path=path, changed=True, failed=False, size=None, count=1)
+                   for path in result.get('changed_files', [])]
+        if summary.get('unchanged'):
+            records.append(dict(path=None, changed=False, failed=False, size=None,
+                                count=summary['unchanged']))
+        return records
+    if 'verified' in result:
+        # Аудит ничего не меняет
+        return []
+    if 'results' in result:
+        return [dict(path=item.get('path'), changed=bool(item.get('changed')),
+                     failed=bool(item.get('failed')), size=item.get('size'),
+                     written=item.get('written'), count=1)
+                for item in result['results']]
+    return [dict(path=result.get('path'), changed=bool(result.get('changed')),
+                 failed=failed or bool(result.get('failed')), size=result.get('size'),
+                 written=result.get('written'), count=1)]
+
+
+class HostMetrics:
+    """Накопленные метрики задач my_own_module одного хоста."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failed_calls = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.bytes_skipped = 0
+        self.durations = []
+        # фаза -> [секунды, вызовы, байты]
+        self.phases = {}
+
+    def add(self, result, records, duration, failed=False):
+        self.calls += 1
+        self.failed_calls += failed
+        self.durations.append(duration)
+        written = 0
+        skipped = 0
+        for record in records:
+            if record['failed']:
+                self.failed += record['count']
+            elif record['changed']:
+                self.changed += record['count']
+                if record.get('written') is not None:
+                    written += record['written']
+                else:
+                    written += record['size'] or 0
+            else:
+                self.unchanged += record['count']
+                skipped += record['size'] or 0
+
+        phases = (result.get('timings') or {}).get('phases', {})
+        for name, totals in phases.items():
+            entry = self.phases.setdefault(name, [0.0, 0, 0])
+            entry[0] += totals.get('seconds', 0.0)
+            entry[1] += totals.get('calls', 0)
+            entry[2] += totals.get('bytes', 0)
+        if 'write' in phases:
+            # Замеры модуля точнее: изменение только прав ничего не записывает
+            written = phases['write'].get('bytes', 0)
+        self.bytes_written += written
+        self.bytes_skipped += skipped
+        return written, skipped
+
+
+class CallbackModule(CallbackBase):
+    """Собирает метрики задач my_own_module и выводит их в конце запуска."""
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'my_namespace.my_collection.my_own_module_metrics'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.run_id = uuid.uuid4().hex
+        self.hosts = {}
+        self.path_durations = {}
+        # (хост, задача) -> время начала задачи или завершения предыдущего элемента цикла
+        self.started = {}
+        self.loop_tasks = set()
+        self.jsonl = []
+
+    def is_module_task(self, task):
+        return (getattr(task, 'resolved_action', None) or task.action) in MODULE_ACTIONS
+
+    def elapsed(self, key):
+        now = time.monotonic()
+        start = self.started.get(key, now)
+        self.started[key] = now
+        return now - start
+
+    def record(self, result, duration, failed=False):
+        host = result._host.get_name()
+        data = result._result
+        records = file_records(data, failed)
+        written, skipped = self.hosts.setdefault(host, HostMetrics()).add(data, records, duration,
+                                                                         failed)
+        paths = [r['path'] for r in records if r['path'] is not None]
+        if len(paths) == 1:
+            # Время вызова можно отнести к пути, только если он один
+            self.path_durations.setdefault(paths[0], []).append(duration)
+        line = dict(run_id=self.run_id, timestamp=time.time(), host=host,
+                    task=result._task.get_name(), duration=round(duration, 6),
+                    failed=failed, changed=bool(data.get('changed')),
+                    files=sum(r['count'] for r in records),
+                    changed_files=sum(r['count'] for r in records if r['changed']),
+                    bytes_written=written, bytes_skipped=skipped)
+        if len(paths) == 1:
+            line['path'] = paths[0]
+        if data.get('timings'):
+            line['timings'] = data['timings']
+        self.jsonl.append(line)
+
+    def v2_runner_on_start(self, host, task):
+        self.started[(host.get_name(), task._uuid)] = time.monotonic()
+
+    def item_done(self, result, failed):
+        key = (result._host.get_name(), result._task._uuid)
+        if not self.is_module_task(result._task):
+            return
+        self.loop_tasks.add(key)
+        self.record(result, self.elapsed(key), failed)
+
+    def task_done(self, result, failed):
+        # При ignore_errors результат уже не помечен failed, поэтому признак
+        # ошибки берётся из того, какой метод вызван
+        key = (result._host.get_name(), result._task._uuid)
+        if key in self.loop_tasks:
+            # Элементы цикла уже учтены по отдельности
+            self.loop_tasks.discard(key)
+            self.started.pop(key, None)
+            return
+        if result._task.loop or not self.is_module_task(result._task):
+            self.started.pop(key, None)
+            return
+        self.record(result, self.elapsed(key), failed)
+        self.started.pop(key, None)
+
+    def v2_runner_item_on_ok(self, result):
+        self.item_done(result, False)
+
+    def v2_runner_item_on_failed(self, result):
+        self.item_done(result, True)
+
+    def v2_runner_on_ok(self, result):
+        self.task_done(result, False)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.task_done(result, True)
+
+    def v2_playbook_on_stats(self, stats):
+        if not self.hosts:
+            return
+        self._display.banner("MY_OWN_MODULE METRICS")
+        for host in sorted(self.hosts):
+            metrics = self.hosts[host]
+            durations = sorted(metrics.durations)
+            self._display.display(
+                f"{host}: вызовов {metrics.calls}, файлов изменено {metrics.changed}, "
+                f"без изменений {metrics.unchanged}, с ошибкой {metrics.failed}; "
+                f"записано {metrics.bytes_written} Б, не понадобилось записывать "
+                f"{metrics.bytes_skipped} Б; время p50 {percentile(durations, 0.5):.3f} с, "
+                f"p90 {percentile(durations, 0.9):.3f} с, p99 {percentile(durations, 0.99):.3f} с, "
+                f"макс. {durations[-1]:.3f} с")
+            for name in sorted(metrics.phases):
+                seconds, calls, nbytes = metrics.phases[name]
+                self._display.display(f"    {name}: {seconds:.3f} с, вызовов {calls}, {nbytes} Б")
+
+        top = sorted(((percentile(sorted(values), 0.9), path, sorted(values))
+                      for path, values in self.path_durations.items()), reverse=True)
+        if top and self.get_option('top_paths'):
+            self._display.display("Самые медленные пути (p90):")
+            for p90, path, values in top[:self.get_option('top_paths')]:
+                self._display.display(f"    {path}: вызовов {len(values)}, "
+                                      f"p50 {percentile(values, 0.5):.3f} с, p90 {p90:.3f} с, "
+                                      f"макс. {values[-1]:.3f} с")
+
+        if self.get_option('prometheus_file'):
+            self.write_prometheus(self.get_option('prometheus_file'))
+        if self.get_option('jsonl_file'):
+            with open(self.get_option('jsonl_file'), 'a') as f:
+                for line in self.jsonl:
+                    f.write(json.dumps(line, sort_keys=True) + '\n')
+
+    def write_prometheus(self, path):
+        """Записывает метрики в формате Prometheus textfile через временный файл."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{escape(value)}"' for key, value in labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        hosts = sorted(self.hosts.items())
+        metric('my_own_module_calls_total', 'counter', "Вызовы модуля",
+               [((('host', h),), m.calls) for h, m in hosts])
+        metric('my_own_module_files_total', 'counter', "Обработанные файлы по исходу",
+               [((('host', h), ('result', result)), getattr(m, result))
+                for h, m in hosts for result in ('changed', 'unchanged', 'failed')])
+        metric('my_own_module_bytes_written_total', 'counter', "Записанные байты",
+               [((('host', h),), m.bytes_written) for h, m in hosts])
+        metric('my_own_module_bytes_skipped_total', 'counter',
+               "Байты, которые не пришлось записывать",
+               [((('host', h),), m.bytes_skipped) for h, m in hosts])
+        samples = []
+        for h, m in hosts:
+            durations = sorted(m.durations)
+            samples.extend(((('host', h), ('quantile', str(q))), round(percentile(durations, q), 6))
+                           for q in QUANTILES)
+        metric('my_own_module_call_duration_seconds', 'summary', "Время вызова модуля", samples)
+        lines.extend(f"my_own_module_call_duration_seconds_sum{{host=\"{escape(h)}\"}} "
+                     f"{round(sum(m.durations), 6)}" for h, m in hosts)
+        lines.extend(f"my_own_module_call_duration_seconds_count{{host=\"{escape(h)}\"}} "
+                     f"{len(m.durations)}" for h, m in hosts)
+        metric('my_own_module_phase_seconds_total', 'counter', "Время фаз по замерам profile",
+               [((('host', h), ('phase', name)), round(totals[0], 6))
+                for h, m in hosts for name, totals in sorted(m.phases.items())])
+        metric('my_own_module_phase_bytes_total', 'counter', "Байты фаз по замерам profile",
+               [((('host', h), ('phase', name)), totals[2])
+                for h, m in hosts for name, totals in sorted(m.phases.items())])
+
+        dir_path = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.my_own_module_metrics-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
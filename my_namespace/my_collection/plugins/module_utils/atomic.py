@@ -0,0 +1,308 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import errno
+import os
+import shutil
+import tempfile
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.my_utils import (
+    DEFAULT_BUFFER_SIZE, new_hasher)
+
+DURABILITY_LEVELS = ('none', 'file', 'full', 'batch')
+
+# Ошибки, при которых способ размещения не поддерживается и нужно пробовать следующий
+UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EPERM,
+                      errno.EOPNOTSUPP, errno.ENOSYS, errno.EMLINK)
+# Ошибки, при которых расширенный атрибут не поддерживается или недоступен и пропускается
+XATTR_SKIP_ERRNOS = (errno.ENOTSUP, errno.EOPNOTSUPP, errno.EPERM, errno.EACCES, errno.ENODATA)
+# Сколько байт просить у ядра за один вызов copy_file_range/sendfile
+KERNEL_COPY_CHUNK = 1 << 30
+
+
+def current_umask():
+    """Возвращает umask процесса (os.umask можно только установить)."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Читается один раз при импорте: смена umask небезопасна при работе в потоках
+UMASK = current_umask()
+
+
+def temp_path_for(path):
+    """Создаёт пустой временный файл рядом с path и возвращает его имя."""
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.',
+                                    suffix='.tmp', dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    return tmp_path
+
+
+def read_xattrs(path):
+    """Возвращает расширенные атрибуты файла: ACL, метку SELinux и прочие xattr.
+
+    Недоступные атрибуты пропускаются, без поддержки xattr результат пустой.
+    """
+    if not hasattr(os, 'listxattr'):
+        return {}
+    try:
+        names = os.listxattr(path)
+    except OSError as e:
+        if e.errno not in XATTR_SKIP_ERRNOS:
+            raise
+        return {}
+    attrs = {}
+    for name in names:
+        try:
+            attrs[name] = os.getxattr(path, name)
+        except OSError as e:
+            if e.errno not in XATTR_SKIP_ERRNOS:
+                raise
+    return attrs
+
+
+def copy_attributes(src, dst, xattrs=True):
+    """Переносит владельца, права и расширенные атрибуты src на dst.
+
+    Замена файла создаёт новый inode, поэтому ACL (system.posix_acl_*) и метка
+    SELinux (security.selinux) переносятся явно, как в AnsibleModule.atomic_move.
+    Владелец меняется первым: chown сбрасывает биты setuid/setgid и security.capability.
+    """
+    st = os.stat(src)
+    if (st.st_uid, st.st_gid) != (os.getuid(), os.getgid()):
+        os.chown(dst, st.st_uid, st.st_gid)
+    os.chmod(dst, st.st_mode & 0o7777)
+    if not xattrs:
+        return
+    for name, value in read_xattrs(src).items():
+        try:
+            os.setxattr(dst, name, value)
+        except OSError as e:
+            if e.errno not in XATTR_SKIP_ERRNOS:
+                raise
+
+
+def fsync_directory(path):
+    """Сбрасывает на диск запись каталога (создание, переименование, удаление)."""
+    fd = os.open(path or '.', os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def syncfs(path):
+    """Сбрасывает на диск всю файловую систему, содержащую path."""
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if libc.syncfs(fd) == 0:
+                return
+        finally:
+            os.close(fd)
+    except (AttributeError, OSError):
+        pass
+    os.sync()
+
+
+class SyncPolicy:
+    """Политика сброса данных на диск при записи файлов.
+
+    none  — без fsync, надёжность определяется файловой системой;
+    file  — fsync каждого записанного файла;
+    full  — fsync файла и каталога, в котором он переименован;
+    batch — один syncfs на каждую затронутую файловую систему в конце запуска.
+    """
+
+    def __init__(self, level='none'):
+        self.level = level
+        self.pending = {}
+
+    def sync_file(self, fd):
+        """Вызывается для временного файла до переименования."""
+        if self.level in ('file', 'full'):
+            os.fsync(fd)
+
+    def sync_entry(self, path):
+        """Вызывается после переименования или удаления path."""
+        dir_path = os.path.dirname(path) or '.'
+        if self.level == 'full':
+            fsync_directory(dir_path)
+        elif self.level == 'batch':
+            try:
+                self.pending.setdefault(os.stat(dir_path).st_dev, dir_path)
+            except OSError:
+                pass
+
+    def finish(self):
+        """Завершает запуск: для batch — один syncfs на файловую систему."""
+        pending, self.pending = self.pending, {}
+        for dir_path in pending.values():
+            syncfs(dir_path)
+
+
+NO_SYNC = SyncPolicy()
+
+
+def atomic_write(path, data, sync=NO_SYNC):
+    """Записывает байты во временный файл и атомарно подменяет им path.
+
+    Права и владелец существующего файла сохраняются, новый файл получает
+    права по umask, как при обычном open().
+    """
+    tmp_path = temp_path_for(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            sync.sync_file(f.fileno())
+        if os.path.exists(path):
+            copy_attributes(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    sync.sync_entry(path)
+
+
+def append_data(path, data, sync=NO_SYNC):
+    """Дописывает байты в конец path (O_APPEND), создавая файл при необходимости.
+
+    Запись не атомарна, но существующие данные не переписываются, а O_APPEND
+    не даёт потерять строки, которые одновременно дописывают другие процессы.
+    """
+    created = not os.path.exists(path)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        sync.sync_file(fd)
+    finally:
+        os.close(fd)
+    if created:
+        sync.sync_entry(path)
+
+
+def file_chunks(path, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Читает файл блоками в один переиспользуемый буфер.
+
+    Каждый блок действителен только до следующей итерации.
+    """
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            yield view[:n]
+
+
+def atomic_write_chunks(path, chunks, sync=NO_SYNC, algorithm='sha1', expected=None):
+    """Записывает поток блоков в path через временный файл и возвращает его сумму.
+
+    Блоки хешируются по пути, поэтому память не зависит от размера данных.
+    Если задан expected и сумма записанных данных с ним не совпала, path
+    не изменяется.
+    """
+    hasher = new_hasher(algorithm)
+    tmp_path = temp_path_for(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                hasher.update(chunk)
+                f.write(chunk)
+            f.flush()
+            sync.sync_file(f.fileno())
+        checksum = hasher.hexdigest()
+        if expected is not None and checksum != expected:
+            raise ValueError(f"Контрольная сумма данных для {path} ({checksum}) не совпадает "
+                             f"с ожидаемой ({expected})")
+        if os.path.exists(path):
+            copy_attributes(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    sync.sync_entry(path)
+    return checksum
+
+
+def _copy_file_range(in_fd, out_fd):
+    while os.copy_file_range(in_fd, out_fd, KERNEL_COPY_CHUNK):
+        pass
+
+
+def _sendfile(in_fd, out_fd):
+    offset = 0
+    while True:
+        sent = os.sendfile(out_fd, in_fd, offset, KERNEL_COPY_CHUNK)
+        if not sent:
+            break
+        offset += sent
+
+
+KERNEL_COPY_METHODS = (('copy_file_range', _copy_file_range), ('sendfile', _sendfile))
+
+
+def copy_fileobj(fsrc, fdst, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Копирует данные между открытыми файлами, по возможности в ядре.
+
+    Способы пробуются по порядку: copy_file_range (на части файловых систем
+    это reflink), sendfile и буферное копирование. Возвращает имя способа.
+    """
+    size = os.fstat(fsrc.fileno()).st_size
+    for method, copy in KERNEL_COPY_METHODS:
+        if not hasattr(os, method):
+            continue
+        try:
+            copy(fsrc.fileno(), fdst.fileno())
+            # Некоторые ФС (например, procfs) сообщают о конце данных сразу
+            if os.fstat(fdst.fileno()).st_size == size:
+                return method
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+    shutil.copyfileobj(fsrc, fdst, buffer_size)
+    return 'buffered'
+
+
+def atomic_copy(src, path, sync=NO_SYNC):
+    """Копирует файл src в path через временный файл, см. copy_fileobj.
+
+    Данные по возможности не проходят через буферы Python. Возвращает
+    использованный способ копирования.
+    """
+    tmp_path = temp_path_for(path)
+    try:
+        with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+            method = copy_fileobj(fsrc, fdst)
+            fdst.flush()
+            sync.sync_file(fdst.fileno())
+        if os.path.exists(path):
+            copy_attributes(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    sync.sync_entry(path)
+    return method
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import errno
+import os
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.atomic import (
+    NO_SYNC, UMASK, UNSUPPORTED_ERRNOS, atomic_write, atomic_write_chunks, copy_attributes,
+    copy_fileobj, read_xattrs, temp_path_for)
+
+DEFAULT_BLOB_STORE = '/var/cache/my_collection/blobs'
+PLACEMENT_METHODS = ('reflink', 'hardlink', 'copy')
+# В blob лежит содержимое файлов с любыми правами, в том числе секретов:
+# читать хранилище может только его владелец
+STORE_MODE = 0o700
+BLOB_MODE = 0o600
+
+# ioctl FICLONE из linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink(src, dst, sync=NO_SYNC):
+    """Клонирует src в dst (FICLONE) без копирования данных."""
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        sync.sync_file(fdst.fileno())
+
+
+def copy_data(src, dst, sync=NO_SYNC):
+    """Копирует src в dst через copy_file_range, если ядро это умеет."""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        copy_fileobj(fsrc, fdst)
+        fdst.flush()
+        sync.sync_file(fdst.fileno())
+
+
+def detach_link(path, sync=NO_SYNC):
+    """Превращает жёсткую ссылку в отдельный файл, чтобы не менять общий inode."""
+    st = os.stat(path)
+    if st.st_nlink <= 1:
+        return False
+    tmp_path = temp_path_for(path)
+    try:
+        copy_data(path, tmp_path, sync)
+        copy_attributes(path, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    sync.sync_entry(path)
+    return True
+
+
+class BlobStore:
+    """Хранилище содержимого по контрольной сумме на управляемом хосте."""
+
+    def __init__(self, root, methods=PLACEMENT_METHODS, sync=NO_SYNC):
+        self.root = root
+        self.methods = methods
+        self.sync = sync
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest)
+
+    def has(self, digest):
+        return os.path.isfile(self.path_for(digest))
+
+    def contains(self, st, digest=None):
+        """Проверяет, что inode из st — один из blob хранилища.
+
+        digest — вероятная сумма содержимого: если blob с ней и есть этот inode,
+        каталог хранилища не просматривается.
+        """
+        try:
+            if digest is not None:
+                blob = os.stat(self.path_for(digest))
+                if (blob.st_dev, blob.st_ino) == (st.st_dev, st.st_ino):
+                    return True
+            if os.stat(self.root).st_dev != st.st_dev:
+                return False
+            with os.scandir(self.root) as entries:
+                return any(entry.inode() == st.st_ino for entry in entries)
+        except (FileNotFoundError, PermissionError):
+            return False
+
+    def prepare(self):
+        """Создаёт каталог хранилища и закрывает доступ к нему другим пользователям.
+
+        Права исправляются и у каталога, созданного раньше с более широкими правами.
+        """
+        os.makedirs(self.root, STORE_MODE, exist_ok=True)
+        if os.stat(self.root).st_mode & 0o777 != STORE_MODE:
+            os.chmod(self.root, STORE_MODE)
+
+    def add(self, digest, data):
+        """Сохраняет содержимое, если blob с такой суммой ещё не записан."""
+        blob_path = self.path_for(digest)
+        self.prepare()
+        if os.path.isfile(blob_path):
+            return False
+        atomic_write(blob_path, data, self.sync)
+        os.chmod(blob_path, BLOB_MODE)
+        return True
+
+    def add_chunks(self, digest, chunks, algorithm='sha1'):
+        """Сохраняет поток блоков, проверяя его контрольную сумму."""
+        blob_path = self.path_for(digest)
+        self.prepare()
+        if os.path.isfile(blob_path):
+            return False
+        atomic_write_chunks(blob_path, chunks, self.sync, algorithm, digest)
+        os.chmod(blob_path, BLOB_MODE)
+        return True
+
+    def can_link(self, digest, mode=None, uid=-1, gid=-1, path=None):
+        """Жёсткая ссылка разделяет inode с blob, поэтому атрибуты должны совпадать.
+
+        Незаданные атрибуты берутся у существующего файла path (у нового файла
+        права — по umask): ссылка не должна менять права, владельца и расширенные
+        атрибуты, которые копирование и reflink сохранили бы.
+        """
+        blob_path = self.path_for(digest)
+        st = os.stat(blob_path)
+        current = None
+        if path is not None:
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                pass
+        if current is not None:
+            if mode is None:
+                mode = current.st_mode & 0o7777
+            if uid == -1:
+                uid = current.st_uid
+            if gid == -1:
+                gid = current.st_gid
+            # Общий inode несёт xattr blob: ACL и метка SELinux файла пропали бы
+            if read_xattrs(path) != read_xattrs(blob_path):
+                return False
+        elif mode is None:
+            # Новый файл получил бы права по umask, а не права blob
+            mode = 0o666 & ~UMASK
+        if mode is not None and st.st_mode & 0o7777 != mode:
+            return False
+        if uid != -1 and st.st_uid != uid:
+            return False
+        if gid != -1 and st.st_gid != gid:
+            return False
+        return True
+
+    def place(self, digest, path, mode=None, uid=-1, gid=-1):
+        """Размещает blob по пути path первым сработавшим способом.
+
+        Возвращает название использованного способа.
+        """
+        blob_path = self.path_for(digest)
+        self.prepare()
+        for method in self.methods:
+            if method == 'hardlink' and not self.can_link(digest, mode, uid, gid, path):
+                continue
+            tmp_path = temp_path_for(path)
+            try:
+                if method == 'reflink':
+                    reflink(blob_path, tmp_path, self.sync)
+                elif method == 'hardlink':
+                    os.unlink(tmp_path)
+                    os.link(blob_path, tmp_path)
+                else:
+                    copy_data(blob_path, tmp_path, self.sync)
+                if method != 'hardlink':
+                    if os.path.exists(path):
+                        copy_attributes(path, tmp_path)
+                    else:
+                        # Новый файл получает права по umask, как при atomic_write,
+                        # а не закрытые права и метку SELinux blob
+                        os.chmod(tmp_path, 0o666 & ~UMASK)
+                os.replace(tmp_path, path)
+                self.sync.sync_entry(path)
+                return method
+            except OSError as e:
+                if os.path.lexists(tmp_path):
+                    os.unlink(tmp_path)
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+        raise OSError(errno.EOPNOTSUPP,
+                      f"Не удалось разместить blob {digest} способами: {', '.join(self.methods)}")
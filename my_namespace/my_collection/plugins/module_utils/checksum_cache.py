@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_CHECKSUM_CACHE = '/var/cache/my_collection/checksums.json'
+DEFAULT_MAX_ENTRIES = 10000
+
+# Файлы, изменённые позже этого срока, не кешируются: запись в тот же
+# квант времени файловой системы не изменила бы mtime/ctime
+RACY_WINDOW = 2.0
+
+
+class ChecksumCache:
+    """Кеш контрольных сумм файлов на управляемом хосте.
+
+    Запись ищется по (st_dev, st_ino) и действительна, только пока у файла
+    те же размер, st_mtime_ns и st_ctime_ns. ctime нельзя выставить вручную,
+    поэтому любое изменение файла делает запись недействительной.
+    Методы можно вызывать из нескольких потоков.
+    """
+
+    def __init__(self, path=DEFAULT_CHECKSUM_CACHE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key(st):
+        return f"{st.st_dev}:{st.st_ino}"
+
+    @staticmethod
+    def identity(st):
+        return [st.st_size, st.st_mtime_ns, st.st_ctime_ns]
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    def get(self, st, algorithm='sha1'):
+        """Возвращает сохранённую сумму файла или None."""
+        with self.lock:
+            entry = self.entries.get(self.key(st))
+            if entry is None:
+                return None
+            if entry['stat'] != self.identity(st):
+                # Файл изменился с момента вычисления суммы
+                del self.entries[self.key(st)]
+                self.dirty = True
+                return None
+            digest = entry['digests'].get(algorithm)
+            if digest is not None:
+                entry['used'] = time.time()
+                self.dirty = True
+            return digest
+
+    def put(self, st, digest, algorithm='sha1'):
+        """Запоминает сумму файла с метаданными st."""
+        now = time.time()
+        if now - max(st.st_mtime_ns, st.st_ctime_ns) / 1e9 < RACY_WINDOW:
+            return False
+        key = self.key(st)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['stat'] != self.identity(st):
+                entry = self.entries[key] = dict(stat=self.identity(st), digests={})
+            entry['digests'][algorithm] = digest
+            entry['used'] = now
+            self.dirty = True
+        return True
+
+    def evict(self):
+        """Оставляет не больше max_entries последних использованных записей."""
+        if len(self.entries) <= self.max_entries:
+            return
+        keep = sorted(self.entries, key=lambda k: self.entries[k]['used'], reverse=True)
+        self.entries = dict((k, self.entries[k]) for k in keep[:self.max_entries])
+
+    def save(self):
+        """Атомарно записывает индекс, если он изменился."""
+        if not self.dirty:
+            return False
+        self.evict()
+        dir_path = os.path.dirname(self.path) or '.'
+        os.makedirs(dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.checksums.', suffix='.tmp', dir=dir_path)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self.dirty = False
+        return True
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import math
+import zlib
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.my_utils import (
+    DEFAULT_BUFFER_SIZE, compress_content, decompress_chunks)
+
+MIN_BLOCK_SIZE = 2 * 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+# Файлы меньше этого размера выгоднее передать целиком
+DELTA_MIN_SIZE = 64 * 1024
+# Доля новых данных, после которой дельта теряет смысл
+DEFAULT_MAX_LITERAL_RATIO = 0.5
+# Сколько окон подряд без совпадений просматривается сверх уже совпавших данных:
+# побайтовый поиск в Python медленный, а на несвязанных данных бесполезен
+MAX_UNMATCHED_WINDOWS = 64
+
+ADLER_MOD = 65521
+
+
+def choose_block_size(size):
+    """Подбирает размер блока порядка квадратного корня из размера файла, как rsync."""
+    block_size = int(math.sqrt(size)) // 1024 * 1024
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, block_size))
+
+
+def strong_digest(block):
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def block_signatures(path, block_size=None):
+    """Вычисляет слабую (adler32) и сильную сумму каждого полного блока файла.
+
+    Неполный последний блок в подпись не входит и всегда передаётся данными.
+    """
+    with open(path, 'rb') as f:
+        if block_size is None:
+            f.seek(0, 2)
+            block_size = choose_block_size(f.tell())
+            f.seek(0)
+        weak = []
+        strong = []
+        while True:
+            block = f.read(block_size)
+            if len(block) < block_size:
+                break
+            weak.append(zlib.adler32(block))
+            strong.append(strong_digest(block))
+    return dict(block_size=block_size, weak=weak, strong=strong)
+
+
+def compute_delta(source, signatures, max_literal=None):
+    """Строит список операций, превращающих файл с подписью signatures в source.
+
+    source — bytes или mmap. Операция ['c', индекс, число] копирует блоки
+    существующего файла, ['d', данные] добавляет сжатые данные. Возвращает None,
+    если новых данных больше max_literal байт или участок без совпадений длиннее
+    MAX_UNMATCHED_WINDOWS блоков плюс уже совпавшие данные: так несвязанный файл
+    отбрасывается после нескольких окон, а не после max_literal байт поиска.
+    """
+    block_size = signatures['block_size']
+    strong = signatures['strong']
+    table = {}
+    for index, weak in enumerate(signatures['weak']):
+        table.setdefault(weak, []).append(index)
+
+    ops = []
+    matched = 0
+    last_match = 0
+    unmatched_limit = MAX_UNMATCHED_WINDOWS * block_size
+    literal_total = 0
+    literal_start = 0
+    pos = 0
+    end = len(source)
+    weak = None
+
+    def flush_literal(stop):
+        if stop > literal_start:
+            ops.append(['d', compress_content(bytes(source[literal_start:stop]))])
+
+    while pos + block_size <= end:
+        if weak is None:
+            weak = zlib.adler32(source[pos:pos + block_size])
+            a = weak & 0xffff
+            b = weak >> 16
+
+        candidates = table.get(weak)
+        if candidates:
+            digest = strong_digest(source[pos:pos + block_size])
+            match = next((i for i in candidates if strong[i] == digest), None)
+            if match is not None:
+                literal_total += pos - literal_start
+                flush_literal(pos)
+                if ops and ops[-1][0] == 'c' and ops[-1][1] + ops[-1][2] == match:
+                    ops[-1][2] += 1
+                else:
+                    ops.append(['c', match, 1])
+                pos += block_size
+                literal_start = last_match = pos
+                matched += block_size
+                weak = None
+                continue
+
+        # Сдвигаем окно на байт: скользящий пересчёт adler32
+        if pos + block_size < end:
+            out_byte = source[pos]
+            in_byte = source[pos + block_size]
+            a = (a - out_byte + in_byte) % ADLER_MOD
+            b = (b - block_size * out_byte + a - 1) % ADLER_MOD
+            weak = (b << 16) | a
+        pos += 1
+        if max_literal is not None and literal_total + pos - literal_start > max_literal:
+            return None
+        if pos - last_match > unmatched_limit + matched:
+            return None
+        if pos - literal_start >= DEFAULT_BUFFER_SIZE * 16:
+            # Длинные участки новых данных передаются частями
+            literal_total += pos - literal_start
+            flush_literal(pos)
+            literal_start = pos
+
+    literal_total += end - literal_start
+    if max_literal is not None and literal_total > max_literal:
+        return None
+    flush_literal(end)
+    return ops
+
+
+def delta_stats(ops, block_size):
+    """Считает, сколько байт берётся из существующего файла."""
+    return sum(op[2] for op in ops if op[0] == 'c') * block_size
+
+
+def apply_delta(basis_path, ops, block_size, chunk_size=DEFAULT_BUFFER_SIZE):
+    """Восстанавливает новое содержимое блоками по операциям compute_delta."""
+    with open(basis_path, 'rb') as basis:
+        for op in ops:
+            if op[0] == 'c':
+                basis.seek(op[1] * block_size)
+                remaining = op[2] * block_size
+                while remaining:
+                    chunk = basis.read(min(remaining, chunk_size))
+                    if not chunk:
+                        raise ValueError(f"Файл {basis_path} короче, чем в подписи")
+                    remaining -= len(chunk)
+                    yield chunk
+            elif op[0] == 'd':
+                for chunk in decompress_chunks(op[1], 'zlib', chunk_size):
+                    yield chunk
+            else:
+                raise ValueError(f"Неизвестная операция дельты: {op[0]}")
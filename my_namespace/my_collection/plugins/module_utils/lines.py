@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import os
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.my_utils import (
+    DEFAULT_BUFFER_SIZE)
+
+# Окончания строк, которые не входят в сравниваемую строку
+LINE_ENDINGS = b'\r\n'
+
+
+def line_pieces(f, limit, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Читает файл построчно частями не длиннее limit байт.
+
+    Даёт (часть, целая): целая — часть является всей строкой. Строка длиннее
+    limit отдаётся несколькими частями до buffer_size байт с целая=False,
+    поэтому память не зависит от длины строк в файле.
+    """
+    while True:
+        piece = f.readline(limit)
+        if not piece:
+            return
+        if len(piece) < limit or piece.endswith(b'\n'):
+            yield piece, True
+            continue
+        # Слишком длинная строка: ни с одной из искомых она не совпадёт
+        yield piece, False
+        while piece and not piece.endswith(b'\n'):
+            piece = f.readline(buffer_size)
+            if piece:
+                yield piece, False
+
+
+def piece_limit(lines):
+    """Длина части, в которую помещается любая из lines с окончанием строки."""
+    return max(len(line) for line in lines) + len(LINE_ENDINGS) + 1
+
+
+def missing_lines(path, lines):
+    """Возвращает строки из lines, которых нет в файле, в исходном порядке.
+
+    Файл читается один раз и только до тех пор, пока не найдены все строки.
+    """
+    if not lines:
+        return []
+    remaining = set(lines)
+    with open(path, 'rb') as f:
+        for piece, whole in line_pieces(f, piece_limit(lines)):
+            if whole:
+                remaining.discard(piece.rstrip(LINE_ENDINGS))
+                if not remaining:
+                    break
+    return [line for line in lines if line in remaining]
+
+
+def has_any_line(path, lines):
+    """Проверяет, есть ли в файле хотя бы одна из строк lines; чтение до первой найденной."""
+    if not lines:
+        return False
+    wanted = set(lines)
+    with open(path, 'rb') as f:
+        for piece, whole in line_pieces(f, piece_limit(lines)):
+            if whole and piece.rstrip(LINE_ENDINGS) in wanted:
+                return True
+    return False
+
+
+def without_lines(path, lines, removed, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Даёт содержимое файла блоками до buffer_size байт, пропуская строки из lines.
+
+    Пропущенные строки добавляются в список removed.
+    """
+    unwanted = set(lines)
+    block = bytearray()
+    with open(path, 'rb') as f:
+        for piece, whole in line_pieces(f, piece_limit(lines), buffer_size):
+            if whole and piece.rstrip(LINE_ENDINGS) in unwanted:
+                removed.append(piece)
+                continue
+            block += piece
+            if len(block) >= buffer_size:
+                yield bytes(block)
+                block.clear()
+    if block:
+        yield bytes(block)
+
+
+def ends_with(path, data):
+    """Проверяет, что файл заканчивается байтами data; читается только хвост файла."""
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size < len(data):
+            return False
+        f.seek(size - len(data))
+        return f.read(len(data)) == data
+
+
+def needs_newline(path):
+    """Проверяет, что непустой файл не заканчивается переводом строки."""
+    return os.path.getsize(path) > 0 and not ends_with(path, b'\n')
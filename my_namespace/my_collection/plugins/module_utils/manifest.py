@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import re
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.my_utils import (
+    parallel_map)
+
+MANIFEST_STATES = ('present', 'absent')
+OCTAL_MODE = re.compile('^[0-7]{1,4}$')
+
+
+def normalize_mode(value, path):
+    """Возвращает права записи числом или None.
+
+    Строка читается как восьмеричная (C("0644")), число берётся как есть,
+    как в модулях Ansible: JSON-число 420 — это 0644.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        mode = value
+    elif isinstance(value, str) and OCTAL_MODE.match(value):
+        mode = int(value, 8)
+    else:
+        raise ValueError(f"Недопустимые права {value!r} в записи {path}: нужна восьмеричная "
+                         "строка, например \"0644\", или число")
+    if not 0 <= mode <= 0o7777:
+        raise ValueError(f"Права {value!r} в записи {path} вне диапазона 0000-7777")
+    return mode
+
+
+def load_manifest(path):
+    """Читает манифест и возвращает список записей с абсолютными путями.
+
+    Манифест — JSON: список записей или объект с ключами files и root.
+    Запись содержит path, checksum, а также необязательные size, mode,
+    owner, group и state. Относительные пути берутся от root. Поля проверяются
+    здесь, mode приводится к числу (см. normalize_mode).
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        root, items = None, data
+    elif isinstance(data, dict):
+        root, items = data.get('root'), data.get('files', [])
+    else:
+        raise ValueError(f"Манифест {path} должен быть списком или объектом")
+
+    entries = []
+    seen = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('path'):
+            raise ValueError(f"Запись {index} манифеста {path} не содержит path")
+        entry = dict(item)
+        entry.setdefault('state', 'present')
+        if entry['state'] not in MANIFEST_STATES:
+            raise ValueError(f"Недопустимое состояние {entry['state']} в записи {entry['path']}")
+        if entry['state'] == 'present' and not entry.get('checksum'):
+            raise ValueError(f"Запись {entry['path']} манифеста не содержит checksum")
+        if entry.get('checksum') is not None and not isinstance(entry['checksum'], str):
+            raise ValueError(f"checksum в записи {entry['path']} должен быть строкой")
+        entry['mode'] = normalize_mode(entry.get('mode'), entry['path'])
+        for key in ('owner', 'group'):
+            if entry.get(key) in (None, ''):
+                entry[key] = None
+            elif not isinstance(entry[key], str):
+                raise ValueError(f"{key} в записи {entry['path']} должен быть именем, "
+                                 f"а не {entry[key]!r}")
+        size = entry.get('size')
+        if size is not None and (isinstance(size, bool) or not isinstance(size, int) or size < 0):
+            raise ValueError(f"size в записи {entry['path']} должен быть неотрицательным "
+                             f"целым числом, а не {size!r}")
+        if root and not os.path.isabs(entry['path']):
+            entry['path'] = os.path.join(root, entry['path'])
+        entry['path'] = os.path.normpath(entry['path'])
+        if entry['path'] in seen:
+            raise ValueError(f"Путь {entry['path']} встречается в манифесте несколько раз")
+        seen.add(entry['path'])
+        entries.append(entry)
+    return entries
+
+
+def scan_directory(dir_path, paths):
+    """Возвращает (путь для записи, stat или None) для файлов paths одного каталога."""
+    try:
+        with os.scandir(dir_path or '.') as it:
+            listing = dict((dir_entry.name, dir_entry) for dir_entry in it)
+    except (FileNotFoundError, NotADirectoryError):
+        listing = {}
+    stats = {}
+    for path in paths:
+        dir_entry = listing.get(os.path.basename(path))
+        if dir_entry is None:
+            stats[path] = (path, None)
+        elif dir_entry.is_symlink():
+            target = os.path.realpath(path)
+            try:
+                stats[path] = (target, os.stat(target))
+            except FileNotFoundError:
+                stats[path] = (target, None)
+        else:
+            stats[path] = (path, dir_entry.stat(follow_symlinks=False))
+    return stats
+
+
+def sweep(entries, parallelism=1):
+    """Собирает stat всех путей манифеста одним os.scandir на каталог.
+
+    Возвращает словарь path -> (путь для записи, stat или None). Отсутствующие
+    файлы определяются по листингу каталога без отдельных системных вызовов,
+    символические ссылки разыменовываются, как в stat_target. Каталоги
+    обходятся параллельно в parallelism потоках.
+    """
+    by_dir = {}
+    for entry in entries:
+        by_dir.setdefault(os.path.dirname(entry['path']), []).append(entry['path'])
+
+    stats = {}
+    for dir_stats in parallel_map(lambda item: scan_directory(*item), by_dir.items(),
+                                  parallelism):
+        stats.update(dir_stats)
+    return stats
@@ -4,11 +4,196 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import base64
 import hashlib
+import mmap
+import os
+import stat
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+    HAS_XXHASH = True
+except ImportError:
+    HAS_XXHASH = False
+
+# Алгоритмы, которые всегда доступны через hashlib
+HASHLIB_ALGORITHMS = ('sha1', 'sha256', 'blake2b')
+# Быстрые некриптографические алгоритмы из необязательного пакета xxhash
+XXHASH_ALGORITHMS = ('xxh64', 'xxh3_64', 'xxh3_128')
+CHECKSUM_ALGORITHMS = HASHLIB_ALGORITHMS + XXHASH_ALGORITHMS
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+# Файлы не меньше этого размера хешируются и сравниваются через mmap
+MMAP_THRESHOLD = 16 * 1024 * 1024
+# Размер окна отображения (кратен ALLOCATIONGRANULARITY)
+MMAP_WINDOW = 16 * 1024 * 1024
+
+
+def new_hasher(algorithm):
+    """Создаёт объект хеширования по имени алгоритма."""
+    if algorithm in HASHLIB_ALGORITHMS:
+        return hashlib.new(algorithm)
+    if algorithm in XXHASH_ALGORITHMS:
+        if not HAS_XXHASH:
+            raise ValueError(f"Для алгоритма {algorithm} нужен пакет xxhash")
+        return getattr(xxhash, algorithm)()
+    raise ValueError(f"Неизвестный алгоритм контрольной суммы: {algorithm}")
+
+
+def calculate_digests(source, algorithms=('sha1',), buffer_size=DEFAULT_BUFFER_SIZE):
+    """Вычисляет несколько контрольных сумм за один проход по данным.
+
+    source может быть строкой, байтами, mmap или файловым объектом,
+    открытым в двоичном режиме. Возвращает словарь {алгоритм: сумма}.
+    """
+    hashers = [(algorithm, new_hasher(algorithm)) for algorithm in algorithms]
+
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        view = memoryview(source)
+        if len(hashers) == 1:
+            hashers[0][1].update(view)
+        else:
+            # Каждый блок обходит все алгоритмы, пока он ещё в кеше процессора
+            for offset in range(0, len(view), buffer_size):
+                chunk = view[offset:offset + buffer_size]
+                for algorithm, hasher in hashers:
+                    hasher.update(chunk)
+    else:
+        buf = bytearray(buffer_size)
+        view = memoryview(buf)
+        while True:
+            n = source.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            for algorithm, hasher in hashers:
+                hasher.update(chunk)
+
+    return dict((algorithm, hasher.hexdigest()) for algorithm, hasher in hashers)
+
+
+def calculate_checksum(data, algorithm='sha256', buffer_size=DEFAULT_BUFFER_SIZE):
+    """Вычисляет контрольную сумму строки, байтов, mmap или файлового объекта."""
+    return calculate_digests(data, (algorithm,), buffer_size)[algorithm]
+
+
+def _mapped_windows(f, size, first, window):
+    """Даёт memoryview окон файла, начиная с уже отображённого first."""
+    mapped = first
+    for offset in range(0, size, window):
+        if mapped is None:
+            mapped = mmap.mmap(f.fileno(), min(window, size - offset),
+                               access=mmap.ACCESS_READ, offset=offset)
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            view.release()
+            mapped.close()
+            mapped = None
+
+
+def mapped_windows(f, threshold=MMAP_THRESHOLD, window=MMAP_WINDOW):
+    """Возвращает итератор memoryview окон открытого файла f, отображённых в память.
+
+    Окно закрывается, когда потребитель переходит к следующему, поэтому
+    резидентная память не растёт с размером файла. Возвращает None, если
+    файл меньше threshold (None — mmap не использовать), не является обычным
+    файлом или файловая система не поддерживает mmap: тогда файл читается
+    обычным образом.
+    """
+    if threshold is None:
+        return None
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode) or st.st_size < max(threshold, 1):
+        return None
+    try:
+        first = mmap.mmap(f.fileno(), min(window, st.st_size), access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # Например, /proc, часть FUSE и сетевых файловых систем
+        return None
+    return _mapped_windows(f, st.st_size, first, window)
+
+
+def file_checksum(path, algorithm='sha1', buffer_size=DEFAULT_BUFFER_SIZE,
+                  mmap_threshold=MMAP_THRESHOLD):
+    """Вычисляет контрольную сумму файла по пути.
+
+    Большой файл хешируется через mmap без копирования в буферы Python.
+    """
+    with open(path, 'rb', buffering=0) as f:
+        windows = mapped_windows(f, mmap_threshold)
+        if windows is None:
+            return calculate_checksum(f, algorithm, buffer_size)
+        hasher = new_hasher(algorithm)
+        for view in windows:
+            hasher.update(view)
+        return hasher.hexdigest()
+
+
+COMPRESSION_METHODS = ('zlib', 'lzma')
+
+
+def compress_content(data, method='zlib'):
+    """Сжимает байты и кодирует их в base64 для передачи в аргументах модуля."""
+    if method == 'lzma':
+        import lzma
+        compressed = lzma.compress(data)
+    else:
+        compressed = zlib.compress(data, 6)
+    return base64.b64encode(compressed).decode('ascii')
+
+
+def decompress_chunks(payload, method='zlib', chunk_size=DEFAULT_BUFFER_SIZE):
+    """Распаковывает данные compress_content блоками не больше chunk_size байт."""
+    compressed = base64.b64decode(payload)
+    if method == 'lzma':
+        import lzma
+        decompressor = lzma.LZMADecompressor()
+        while True:
+            chunk = decompressor.decompress(compressed, chunk_size)
+            compressed = b''
+            if chunk:
+                yield chunk
+            if decompressor.eof:
+                return
+            if decompressor.needs_input:
+                raise ValueError("Сжатые данные обрываются")
+
+    decompressor = zlib.decompressobj()
+    tail = compressed
+    while tail:
+        chunk = decompressor.decompress(tail, chunk_size)
+        tail = decompressor.unconsumed_tail
+        if chunk:
+            yield chunk
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
+    if not decompressor.eof:
+        raise ValueError("Сжатые данные обрываются")
+
+
+def parallel_map(func, items, parallelism=1):
+    """Применяет func к элементам в пуле из не более parallelism потоков.
+
+    Результаты возвращаются в порядке элементов независимо от порядка
+    завершения. Исключения func прерывают обработку, поэтому ошибки
+    отдельных элементов func должна возвращать сама.
+    """
+    items = list(items)
+    if parallelism <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(items))) as executor:
+        return list(executor.map(func, items))
 
-def calculate_checksum(data):
-    """Вычисляет SHA256 контрольную сумму строки."""
-    return hashlib.sha256(data.encode('utf-8')).hexdigest()
 
 def validate_path(path):
     """Проверяет валидность пути."""
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import contextlib
+import os
+import threading
+import time
+
+from ansible.module_utils.parsing.convert_bool import boolean
+
+# Переменные окружения на управляемом узле, включающие замеры без правки задачи
+PROFILE_ENV = 'MY_COLLECTION_PROFILE'
+PROFILE_OUTPUT_ENV = 'MY_COLLECTION_PROFILE_OUTPUT'
+
+
+class PhaseTimer:
+    """Суммирует время (по монотонным часам) и объём данных по фазам обработки.
+
+    Безопасен для потоков: при parallelism > 1 время фаз складывается по всем
+    потокам и может превышать общее время задачи.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.start = time.monotonic()
+
+    @contextlib.contextmanager
+    def phase(self, name, nbytes=0):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start, nbytes)
+
+    def add(self, name, seconds, nbytes=0):
+        with self.lock:
+            totals = self.phases.setdefault(name, dict(seconds=0.0, calls=0, bytes=0))
+            totals['seconds'] += seconds
+            totals['calls'] += 1
+            totals['bytes'] += nbytes
+
+    def as_dict(self):
+        """Возвращает замеры для результата модуля."""
+        with self.lock:
+            phases = dict((name, dict(totals, seconds=round(totals['seconds'], 6)))
+                          for name, totals in self.phases.items())
+        return dict(total=round(time.monotonic() - self.start, 6), phases=phases)
+
+
+class NullTimer:
+    """Замена PhaseTimer при выключенном профилировании: ничего не измеряет."""
+
+    NULL_PHASE = contextlib.nullcontext()
+
+    def phase(self, name, nbytes=0):
+        return self.NULL_PHASE
+
+    def add(self, name, seconds, nbytes=0):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def apply_profile_env(params):
+    """Включает замеры по переменным окружения, если задача их не задала."""
+    if not params.get('profile') and boolean(os.environ.get(PROFILE_ENV) or 'no', strict=False):
+        params['profile'] = True
+    if not params.get('profile_output') and os.environ.get(PROFILE_OUTPUT_ENV):
+        params['profile_output'] = os.environ[PROFILE_OUTPUT_ENV]
+    return params
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import glob
+import os
+import stat
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.atomic import NO_SYNC
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.my_utils import (
+    parallel_map)
+
+def scan_tree(root):
+    """Обходит каталог через os.scandir без перехода по символическим ссылкам.
+
+    Возвращает список (каталог, глубина, [(имя, размер), ...]) в прямом порядке.
+    """
+    tree = []
+    stack = [(root, 0)]
+    while stack:
+        dir_path, depth = stack.pop()
+        files = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, depth + 1))
+                else:
+                    st = entry.stat(follow_symlinks=False)
+                    size = st.st_size if stat.S_ISREG(st.st_mode) else 0
+                    files.append((entry.name, size))
+        tree.append((dir_path, depth, files))
+    return tree
+
+
+def unlink_files(dir_path, files):
+    """Удаляет файлы одного каталога и возвращает их число и размер."""
+    count = 0
+    freed = 0
+    for name, size in files:
+        try:
+            os.unlink(os.path.join(dir_path, name))
+        except FileNotFoundError:
+            continue
+        count += 1
+        freed += size
+    return count, freed
+
+
+def remove_tree(root, sync=NO_SYNC, parallelism=1, check_mode=False):
+    """Удаляет каталог со всем содержимым снизу вверх.
+
+    Файлы разных каталогов удаляются параллельно, затем каталоги — по уровням
+    от самого глубокого, каталоги одного уровня тоже параллельно.
+    Возвращает словарь с числом удалённых файлов, каталогов и байт.
+    """
+    tree = scan_tree(root)
+    if check_mode:
+        return dict(removed_files=sum(len(files) for _, _, files in tree),
+                    removed_dirs=len(tree),
+                    freed_bytes=sum(size for _, _, files in tree for _, size in files))
+
+    removed_files = 0
+    freed_bytes = 0
+    for count, freed in parallel_map(lambda item: unlink_files(item[0], item[2]),
+                                     [item for item in tree if item[2]], parallelism):
+        removed_files += count
+        freed_bytes += freed
+
+    levels = {}
+    for dir_path, depth, _ in tree:
+        levels.setdefault(depth, []).append(dir_path)
+    for depth in sorted(levels, reverse=True):
+        parallel_map(os.rmdir, levels[depth], parallelism)
+    sync.sync_entry(root)
+    return dict(removed_files=removed_files, removed_dirs=len(tree), freed_bytes=freed_bytes)
+
+
+def inside(path, dirs):
+    """Проверяет, лежит ли path внутри одного из каталогов dirs."""
+    parent = os.path.dirname(path)
+    while parent and parent not in dirs:
+        next_parent = os.path.dirname(parent)
+        if next_parent == parent:
+            return False
+        parent = next_parent
+    return bool(parent)
+
+
+def remove_paths(path, recurse=False, sync=NO_SYNC, parallelism=1, check_mode=False,
+                 use_glob=False):
+    """Удаляет файл или (с recurse) каталог path и возвращает суммарные счётчики.
+
+    С use_glob path — шаблон glob, C(**) совпадает с любым числом каталогов.
+    Без него путь всегда буквальный: иначе повторный запуск для уже удалённого
+    C(report[1].csv) удалил бы C(report1.csv).
+    """
+    if use_glob:
+        # C(**) отдаёт и сам каталог, с косой чертой в конце
+        paths = sorted(set(os.path.normpath(match) for match in glob.glob(path, recursive=True)))
+    else:
+        paths = [path] if os.path.lexists(path) else []
+
+    # Все совпадения проверяются до удаления: ошибка не должна оставлять
+    # частично выполненное удаление без счётчиков
+    matches = []
+    dirs = set()
+    for match in paths:
+        if inside(match, dirs):
+            # Удаляется вместе с каталогом
+            continue
+        st = os.lstat(match)
+        if stat.S_ISDIR(st.st_mode):
+            if not recurse:
+                raise IsADirectoryError(f"{match} — каталог, для удаления нужен recurse: true")
+            dirs.add(match)
+        matches.append((match, st))
+
+    totals = dict(removed_files=0, removed_dirs=0, freed_bytes=0)
+    for match, st in matches:
+        if stat.S_ISDIR(st.st_mode):
+            for key, value in remove_tree(match, sync, parallelism, check_mode).items():
+                totals[key] += value
+            continue
+        if not check_mode:
+            os.unlink(match)
+            sync.sync_entry(match)
+        totals['removed_files'] += 1
+        if stat.S_ISREG(st.st_mode):
+            totals['freed_bytes'] += st.st_size
+    return totals
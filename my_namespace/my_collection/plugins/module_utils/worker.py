@@ -0,0 +1,258 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import errno
+import json
+import os
+import socket
+import stat
+import struct
+import threading
+import time
+import traceback
+
+# Меняется при несовместимом изменении формата сообщений
+WORKER_PROTOCOL = 1
+DEFAULT_IDLE_TIMEOUT = 600
+# Время на подключение: недоступный обработчик не должен задерживать задачу
+CONNECT_TIMEOUT = 1.0
+# Время на приём запроса от подключившегося клиента
+REQUEST_TIMEOUT = 60.0
+# Как часто обработчик проверяет простой и запрос на завершение
+ACCEPT_POLL_INTERVAL = 1.0
+LISTEN_BACKLOG = 64
+# Ошибки подключения, означающие, что сокет никто не слушает; остальные
+# (EAGAIN при полной очереди, таймаут) бывают и у занятого обработчика
+DEAD_SOCKET_ERRNOS = (errno.ECONNREFUSED, errno.ENOENT)
+
+HEADER = struct.Struct('!I')
+MAX_MESSAGE_SIZE = 1 << 30
+
+
+def default_socket_path():
+    """Путь к сокету обработчика в закрытом каталоге текущего пользователя."""
+    return os.path.join('/tmp', f".my_collection-worker-{os.getuid()}", 'worker.sock')
+
+
+def prepare_socket_dir(socket_path):
+    """Создаёт каталог сокета и проверяет, что он доступен только владельцу."""
+    os.makedirs(os.path.dirname(socket_path), mode=0o700, exist_ok=True)
+    check_socket_dir(socket_path)
+
+
+def check_socket_dir(socket_path):
+    """Проверяет, что каталог сокета принадлежит пользователю и закрыт для остальных.
+
+    Символическая ссылка не подходит. Иначе каталог в /tmp мог заранее создать другой пользователь и слушать
+    в нём сокет, получая аргументы задач вместе с содержимым файлов.
+    """
+    dir_path = os.path.dirname(socket_path)
+    st = os.lstat(dir_path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(errno.EACCES,
+                              f"Каталог {dir_path} должен принадлежать пользователю "
+                              "и быть закрыт для остальных")
+
+
+def send_message(sock, message):
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Соединение с обработчиком закрыто")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock):
+    (size,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Слишком большое сообщение: {size} байт")
+    return json.loads(recv_exact(sock, size).decode('utf-8'))
+
+
+def call(socket_path, version, args, check_mode=False, validated=False,
+         connect_timeout=CONNECT_TIMEOUT):
+    """Передаёт аргументы модуля постоянному обработчику и возвращает результат.
+
+    validated означает, что args уже проверены AnsibleModule и дополнены
+    значениями по умолчанию. OSError или ValueError означают, что обработчик
+    недоступен или другой версии, и задачу нужно выполнить обычным способом.
+    """
+    check_socket_dir(socket_path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(connect_timeout)
+        sock.connect(socket_path)
+        uid = peer_uid(sock)
+        if uid is not None and uid != os.getuid():
+            raise PermissionError(errno.EACCES, f"Сокет {socket_path} слушает процесс "
+                                                f"другого пользователя (uid {uid})")
+        # Сама задача может выполняться сколь угодно долго
+        sock.settimeout(None)
+        send_message(sock, dict(protocol=WORKER_PROTOCOL, version=version, args=args,
+                                check_mode=check_mode, validated=validated))
+        response = recv_message(sock)
+    finally:
+        sock.close()
+    if 'error' in response:
+        raise ValueError(response['error'])
+    return response['result']
+
+
+def peer_uid(sock):
+    """Возвращает uid процесса на другой стороне сокета (None, если неизвестен)."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+class Worker:
+    """Постоянный процесс, выполняющий задачи модуля, присланные через Unix-сокет.
+
+    Обслуживает запросы только своей версии и только от процессов того же
+    пользователя, каждое соединение — в отдельном потоке, чтобы параллельные
+    задачи (forks) не ждали друг друга. Завершается после idle_timeout секунд
+    без запросов или при запросе другой версии, чтобы его место занял
+    обработчик с новым кодом; начатые задачи при этом дорабатывают.
+    """
+
+    def __init__(self, socket_path, version, handler, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.socket_path = socket_path
+        self.version = version
+        self.handler = handler
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.active = 0
+        self.last_activity = time.monotonic()
+        self.stopping = threading.Event()
+
+    def alive(self):
+        """Проверяет, не обслуживает ли сокет уже другой обработчик."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(self.socket_path)
+            return True
+        except OSError as e:
+            return e.errno not in DEAD_SOCKET_ERRNOS
+        finally:
+            sock.close()
+
+    def idle(self):
+        """Проверяет, что нет начатых задач и запросов не было idle_timeout секунд."""
+        with self.lock:
+            return (self.active == 0
+                    and time.monotonic() - self.last_activity >= self.idle_timeout)
+
+    def serve_connection(self, conn):
+        with self.lock:
+            self.active += 1
+        try:
+            with conn:
+                if not self.handle(conn):
+                    self.stopping.set()
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.last_activity = time.monotonic()
+
+    def serve(self):
+        prepare_socket_dir(self.socket_path)
+        if self.alive():
+            return
+        if os.path.lexists(self.socket_path):
+            # Сокет остался от завершившегося обработчика
+            os.unlink(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        inode = None
+        threads = []
+        try:
+            server.bind(self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            inode = os.stat(self.socket_path).st_ino
+            server.listen(LISTEN_BACKLOG)
+            server.settimeout(min(self.idle_timeout, ACCEPT_POLL_INTERVAL))
+            while not self.stopping.is_set():
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    if self.idle():
+                        break
+                    continue
+                conn.settimeout(None)
+                with self.lock:
+                    self.last_activity = time.monotonic()
+                threads = [thread for thread in threads if thread.is_alive()]
+                thread = threading.Thread(target=self.serve_connection, args=(conn,))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+        finally:
+            server.close()
+            try:
+                # Сокет мог быть уже заменён новым обработчиком
+                if os.stat(self.socket_path).st_ino == inode:
+                    os.unlink(self.socket_path)
+            except OSError:
+                pass
+            # Процесс завершается os._exit, поэтому начатые задачи нужно дождаться
+            for thread in threads:
+                thread.join()
+
+    def handle(self, conn):
+        """Обрабатывает одно соединение; False означает, что пора завершиться."""
+        try:
+            uid = peer_uid(conn)
+            if uid is not None and uid != os.getuid():
+                return True
+            conn.settimeout(REQUEST_TIMEOUT)
+            request = recv_message(conn)
+            if request.get('protocol') != WORKER_PROTOCOL or request.get('version') != self.version:
+                send_message(conn, dict(error=f"Версия обработчика {self.version} не совпадает "
+                                              f"с запрошенной {request.get('version')}"))
+                return False
+            try:
+                result = self.handler(request)
+            except Exception as e:
+                result = dict(failed=True, msg=f"Ошибка: {e}", exception=traceback.format_exc())
+            conn.settimeout(None)
+            send_message(conn, dict(result=result))
+        except (OSError, ValueError):
+            # Клиент отключился или прислал некорректный запрос
+            pass
+        return True
+
+
+def spawn(socket_path, version, handler, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Запускает обработчик в отдельном процессе, отвязанном от текущего.
+
+    Вызывающий процесс сразу продолжает работу; стандартные потоки
+    обработчика перенаправлены в /dev/null, чтобы не держать вывод модуля.
+    """
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.chdir('/')
+        Worker(socket_path, version, handler, idle_timeout).serve()
+    finally:
+        os._exit(0)
@@ -18,19 +18,87 @@ options:
   state:
     description:
       - Состояние файла
+      - C(verify) только проверяет файлы, ничего не меняя, и возвращает расхождения
+        в C(mismatches); сравниваются O(checksum) (или контрольная сумма O(content)
+        и O(src)), O(mode), O(owner) и O(group), если они заданы
+      - C(appended) дописывает O(content) в конец файла (C(O_APPEND)), если файл
+        им ещё не заканчивается; читается только хвост файла, сам файл не переписывается
     type: str
-    choices: [ present, absent ]
+    choices: [ present, absent, verify, appended ]
     default: present
   path:
     description:
       - Путь к файлу
+      - Обязателен, если не заданы O(files) или O(manifest)
+      - При O(state=absent) и O(glob=true) — шаблон glob
     type: path
-    required: true
   content:
     description:
-      - Содержимое файла
+      - Содержимое файла, записывается в кодировке O(encoding)
     type: str
     default: ""
+  content_base64:
+    description:
+      - Содержимое файла в base64, для двоичных данных
+      - Записывается побайтно, без учёта O(encoding); взаимоисключающий с O(content) и O(src)
+    type: str
+  encoding:
+    description:
+      - Кодировка, в которой O(content) записывается в файл
+      - Сравнение, хеширование и размер C(size) считаются по байтам в этой кодировке
+    type: str
+    default: utf-8
+  src:
+    description:
+      - Файл с содержимым, взаимоисключающий с O(content) и O(content_base64)
+      - Action-плагин ищет его на контроллере (как модуль M(ansible.builtin.copy))
+        и передаёт на хост потоково, только если файл на хосте отличается
+      - При O(remote_src=true) это путь к файлу на управляемом хосте
+      - Модуль копирует и хеширует файл блоками, поэтому подходит для больших
+        и двоичных файлов
+    type: path
+  ensure_lines:
+    description:
+      - Строки (без перевода строки), которые должны быть в файле, в кодировке O(encoding)
+      - Файл просматривается потоково один раз с ограниченной памятью; недостающие
+        строки дописываются в конец (C(O_APPEND)) в заданном порядке
+      - При O(state=absent) эти строки удаляются, файл атомарно переписывается
+        только если хотя бы одна из них в нём есть
+      - Взаимоисключающий с O(content), O(content_base64) и O(src)
+    type: list
+    elements: str
+  remote_src:
+    description:
+      - O(src) — файл на управляемом хосте, а не на контроллере
+      - Содержимое не проходит через контроллер; файл копируется, только если его
+        контрольная сумма отличается от суммы O(path)
+      - Копирование выполняет ядро (C(copy_file_range), затем C(sendfile)),
+        буферное копирование используется, если ядро или файловая система их не поддерживают
+    type: bool
+    default: false
+  checksum:
+    description:
+      - Ожидаемая контрольная сумма файла по алгоритму O(checksum_algorithm)
+      - Используется только при O(state=verify), вместо передачи O(content)
+    type: str
+  recurse:
+    description:
+      - Удалять каталоги со всем содержимым при O(state=absent)
+      - Каталог обходится через C(os.scandir), файлы разных каталогов удаляются
+        параллельно в O(parallelism) потоках, затем каталоги снизу вверх
+      - Вместо списка файлов возвращаются C(removed_files), C(removed_dirs)
+        и C(freed_bytes); в режиме проверки — сколько было бы удалено
+    type: bool
+    default: false
+  glob:
+    description:
+      - При O(state=absent) считать O(path) шаблоном glob (C(*), C(?), C([...]),
+        C(**) для любого числа каталогов) и удалять все совпавшие пути
+      - Без этого параметра O(path) всегда означает буквальный путь, в том числе
+        с символами C(*), C(?) и C([)
+      - Возвращаются C(removed_files), C(removed_dirs) и C(freed_bytes), как с O(recurse)
+    type: bool
+    default: false
   mode:
     description:
       - Права доступа к файлу (в восьмеричном формате, например 0644)
@@ -43,11 +111,244 @@ options:
     description:
       - Группа файла
     type: str
+  files:
+    description:
+      - Список файлов для обработки за один запуск модуля
+      - Каждый элемент принимает те же поля, что и сам модуль
+      - Незаданные поля элемента берутся из параметров верхнего уровня
+      - Взаимоисключающий с O(path)
+    type: list
+    elements: dict
+    suboptions:
+      state:
+        description:
+          - Состояние файла
+          - C(verify) допускается только вместе с O(state=verify) верхнего уровня
+        type: str
+        choices: [ present, absent, verify, appended ]
+      path:
+        description: Путь к файлу
+        type: path
+        required: true
+      content:
+        description: Содержимое файла
+        type: str
+      content_base64:
+        description: Содержимое файла в base64, взаимоисключающий с O(files[].content)
+        type: str
+      encoding:
+        description: Кодировка O(files[].content)
+        type: str
+      src:
+        description: Файл с содержимым на контроллере, взаимоисключающий с O(files[].content)
+        type: path
+      remote_src:
+        description: O(files[].src) — файл на управляемом хосте
+        type: bool
+      ensure_lines:
+        description: Строки, которые должны быть в файле (или удалены при O(files[].state=absent))
+        type: list
+        elements: str
+      checksum:
+        description: Ожидаемая контрольная сумма для O(state=verify)
+        type: str
+      recurse:
+        description: Удалять каталоги со всем содержимым при O(state=absent)
+        type: bool
+      glob:
+        description: Считать O(files[].path) шаблоном glob при O(state=absent)
+        type: bool
+      mode:
+        description: Права доступа к файлу
+        type: str
+      owner:
+        description: Владелец файла
+        type: str
+      group:
+        description: Группа файла
+        type: str
+  blob_store:
+    description:
+      - Хранить содержимое в хранилище blob на управляемом хосте
+      - Содержимое записывается в хранилище один раз для каждой контрольной суммы,
+        а в O(path) размещается из него способами из O(blob_placement)
+      - Если нужный blob уже есть на хосте, action-плагин не передаёт O(content)
+      - Каталог хранилища получает права C(0700), а blob — C(0600), поэтому содержимое
+        файлов с закрытыми правами не доступно другим пользователям через хранилище
+    type: bool
+    default: false
+  blob_store_path:
+    description:
+      - Каталог хранилища blob, файлы в нём называются по контрольной сумме содержимого
+    type: path
+    default: /var/cache/my_collection/blobs
+  blob_placement:
+    description:
+      - Способы размещения blob в O(path) в порядке попытки
+      - C(reflink) клонирует данные (btrfs, XFS), C(hardlink) создаёт жёсткую ссылку,
+        C(copy) копирует данные через C(copy_file_range)
+      - Жёсткая ссылка разделяет inode с blob, поэтому используется, только если
+        O(mode), O(owner) и O(group) совпадают с атрибутами blob, а у существующего
+        файла нет своих ACL, метки SELinux и других xattr, которых нет у blob
+      - Перед дописыванием (O(state=appended), O(ensure_lines)) и сменой прав или
+        владельца файл, который является жёсткой ссылкой на blob в O(blob_store_path),
+        заменяется отдельной копией; остальные жёсткие ссылки не разрываются
+      - При замене файла копированием или reflink права, владелец, ACL, метка SELinux
+        и другие xattr прежнего файла переносятся на новый
+    type: list
+    elements: str
+    choices: [ reflink, hardlink, copy ]
+    default: [ reflink, hardlink, copy ]
+  checksum_algorithm:
+    description:
+      - Алгоритм контрольной суммы для сравнения файлов и возвращаемого C(checksum)
+      - C(xxh64), C(xxh3_64) и C(xxh3_128) намного быстрее, но не криптографические;
+        требуют пакета C(xxhash) на хосте и контроллере и несовместимы с O(blob_store)
+    type: str
+    choices: [ sha1, sha256, blake2b, xxh64, xxh3_64, xxh3_128 ]
+    default: sha1
+  checksum_cache:
+    description:
+      - Кешировать контрольные суммы существующих файлов на управляемом хосте
+      - Сумма берётся из кеша без чтения файла, пока у него не изменились
+        устройство, inode, размер, mtime и ctime
+      - Кеш сохраняется и в режиме проверки, так как не относится к управляемым файлам
+    type: bool
+    default: false
+  checksum_cache_path:
+    description:
+      - Файл индекса кеша контрольных сумм
+    type: path
+    default: /var/cache/my_collection/checksums.json
+  checksum_cache_size:
+    description:
+      - Максимальное число записей в кеше, давно не использованные записи вытесняются
+    type: int
+    default: 10000
+  durability:
+    description:
+      - Файлы всегда записываются атомарно, через временный файл и переименование,
+        поэтому при сбое на диске остаётся либо старое, либо новое содержимое
+      - Параметр определяет, когда данные сбрасываются на диск
+      - C(none) — без fsync, быстрее всего
+      - C(file) — fsync каждого записанного файла
+      - C(full) — fsync файла и каталога, в котором он находится
+      - C(batch) — один C(syncfs) на каждую затронутую файловую систему в конце запуска,
+        удобно для O(files) с большим числом файлов
+    type: str
+    choices: [ none, file, full, batch ]
+    default: none
+  content_compression:
+    description:
+      - Сжатие O(content) при передаче на хост, выполняется action-плагином
+      - C(auto) сжимает zlib содержимое больше O(content_compression_threshold)
+        и передаёт его сжатым, только если так выходит меньше
+      - C(zlib) и C(lzma) сжимают всегда, C(none) отключает сжатие
+      - Модуль распаковывает содержимое блоками прямо при записи файла
+        и сверяет его контрольную сумму
+    type: str
+    choices: [ auto, none, zlib, lzma ]
+    default: auto
+  content_compression_threshold:
+    description:
+      - Минимальный размер O(content) в байтах для сжатия в режиме C(auto)
+    type: int
+    default: 65536
+  delta:
+    description:
+      - Передавать изменения больших файлов дельтой, как C(rsync)
+      - Если файл на хосте отличается, модуль возвращает суммы его блоков (C(adler32)
+        и C(blake2b)), а action-плагин отправляет только ссылки на совпавшие блоки
+        и новые данные
+      - Модуль собирает файл из старых блоков и новых данных атомарно
+        и сверяет его контрольную сумму
+      - Используется для файлов от 64 КиБ; если новых данных больше половины
+        размера, содержимое передаётся целиком
+    type: bool
+    default: false
+  delta_block_size:
+    description:
+      - Размер блока дельты в байтах
+      - По умолчанию подбирается по размеру файла (порядка квадратного корня из размера)
+    type: int
+  manifest:
+    description:
+      - Файл манифеста на управляемом хосте для приведения к нему большого набора файлов
+      - Манифест — JSON, список записей или объект с ключами C(files) и C(root)
+        (каталог для относительных путей)
+      - Запись содержит C(path) и C(checksum) (по алгоритму O(checksum_algorithm)),
+        а также необязательные C(size), C(mode), C(owner), C(group) и C(state)
+      - C(mode) — восьмеричная строка (C("0644")) или число, которое берётся как есть
+        (C(420) — это C(0644)); C(owner) и C(group) — имена; C(size) — размер в байтах.
+        Запись с полями другого типа отклоняется с ошибкой до изменения файлов
+      - Модуль читает каждый каталог один раз через C(os.scandir), сравнивает файлы
+        с манифестом и меняет только отличающиеся
+      - Содержимое берётся из хранилища blob O(blob_store_path) по контрольной сумме;
+        записи, для которых blob нет, перечисляются в C(missing_content)
+      - Взаимоисключающий с O(path) и O(files)
+    type: path
+  parallelism:
+    description:
+      - Число потоков для обработки элементов O(files) и записей O(manifest)
+      - Сравнение, хеширование, запись и смена владельца разных файлов выполняются
+        параллельно, что ускоряет работу на многоядерных хостах с быстрыми дисками
+      - Элементы с одинаковым путём обрабатываются последовательно в порядке списка,
+        результаты и ошибки возвращаются в порядке элементов
+      - C(1) — обработка по одному файлу
+    type: int
+    default: 1
+  worker:
+    description:
+      - Выполнять задачи в постоянном процессе-обработчике на управляемом хосте
+      - Модуль передаёт аргументы обработчику через Unix-сокет, а если обработчика нет,
+        выполняет задачу сам и запускает его для следующих задач
+      - При соединении C(local) без C(become) action-плагин обращается к обработчику
+        напрямую, без запуска модуля, что сокращает задержку задачи до нескольких
+        миллисекунд
+      - Обработчик выполняет задачи только той версии коллекции и ansible-core,
+        с которой запущен, принимает запросы только от своего пользователя
+        и завершается после O(worker_idle_timeout) секунд простоя
+      - Задача передаётся обработчику, только если каталог сокета принадлежит
+        пользователю и закрыт для остальных, а сокет слушает процесс того же
+        пользователя; параллельные задачи обслуживаются одновременно
+      - В результатах, полученных напрямую от обработчика, нет полей C(uid), C(owner),
+        C(mode) и других, которые добавляет к результату AnsibleModule
+    type: bool
+    default: false
+  worker_socket:
+    description:
+      - Unix-сокет обработчика
+      - По умолчанию C(/tmp/.my_collection-worker-<uid>/worker.sock) в каталоге,
+        доступном только пользователю
+    type: path
+  worker_idle_timeout:
+    description:
+      - Через сколько секунд без запросов обработчик завершается
+    type: int
+    default: 600
+  profile:
+    description:
+      - Вернуть в C(timings) время и объём данных по фазам обработки файлов
+      - Также включается переменной окружения C(MY_COLLECTION_PROFILE=1) на хосте
+      - Выключенные замеры не добавляют к задаче ни системных вызовов, ни чтения часов
+    type: bool
+    default: false
+  profile_output:
+    description:
+      - Файл на управляемом хосте для статистики C(cProfile) задачи
+        (читается C(python -m pstats))
+      - Также задаётся переменной окружения C(MY_COLLECTION_PROFILE_OUTPUT)
+      - При O(parallelism) больше 1 учитывается только основной поток
+    type: path
 requirements:
   - python >= 3.6
+  - xxhash (для O(checksum_algorithm) из семейства xxh)
 notes:
   - Для удаления файла используйте state=absent
   - Для создания файла используйте state=present
+  - Модуль работает в паре с одноимённым action-плагином, который сначала отправляет
+    на хост только контрольную сумму O(content) и передаёт само содержимое,
+    только если файл на хосте отличается
 '''
 
 EXAMPLES = r'''
@@ -65,18 +366,108 @@ EXAMPLES = r'''
   my_namespace.my_collection.my_own_module:
     path: /tmp/test.txt
     state: absent
+
+# Очистить кеш: каталог целиком и старые журналы по шаблону
+- name: Очистить кеш приложения
+  my_namespace.my_collection.my_own_module:
+    state: absent
+    recurse: true
+    parallelism: 8
+    files:
+      - path: /var/cache/myapp/tmp
+      - path: /var/log/myapp/*.log.[0-9]*
+        glob: true
+
+# Несколько файлов за один запуск
+- name: Разложить конфиги
+  my_namespace.my_collection.my_own_module:
+    mode: "0644"
+    files:
+      - path: /etc/myapp/a.conf
+        content: "a = 1\n"
+      - path: /etc/myapp/b.conf
+        content: "b = 2\n"
+        mode: "0600"
+      - path: /etc/myapp/old.conf
+        state: absent
+
+# Большой двоичный файл с контроллера
+- name: Разложить архив
+  my_namespace.my_collection.my_own_module:
+    path: /opt/app/release.tar.gz
+    src: release.tar.gz
+    mode: "0644"
+
+# Файл, уже загруженный на хост, копируется без участия контроллера
+- name: Установить собранный артефакт
+  my_namespace.my_collection.my_own_module:
+    path: /opt/app/current/app.jar
+    src: /var/tmp/build/app.jar
+    remote_src: true
+
+# Дописать запись в журнал, не перечитывая и не переписывая его
+- name: Отметить развёртывание
+  my_namespace.my_collection.my_own_module:
+    path: /var/log/myapp/deploy.log
+    content: "deployed {{ app_version }}\n"
+    state: appended
+
+# Добавить недостающие строки в конфиг
+- name: Включить параметры
+  my_namespace.my_collection.my_own_module:
+    path: /etc/myapp/extra.conf
+    ensure_lines:
+      - "cache = on"
+      - "workers = 4"
+
+# Одинаковое содержимое по многим путям через хранилище blob
+- name: Разложить одинаковый конфиг
+  my_namespace.my_collection.my_own_module:
+    path: "/srv/app{{ item }}/app.conf"
+    content: "{{ lookup('file', 'app.conf') }}"
+    blob_store: true
+    blob_placement: [ reflink, copy ]
+  loop: "{{ range(1, 21) | list }}"
+
+# Проверить файлы на расхождения, ничего не меняя
+- name: Аудит конфигов
+  my_namespace.my_collection.my_own_module:
+    state: verify
+    parallelism: 8
+    checksum_cache: true
+    files:
+      - path: /etc/myapp/a.conf
+        checksum: "{{ a_conf_sha1 }}"
+        mode: "0644"
+      - path: /etc/myapp/b.conf
+        src: b.conf
+  register: audit
+
+# Много мелких задач подряд через постоянный обработчик
+- name: Разложить фрагменты конфигурации
+  my_namespace.my_collection.my_own_module:
+    path: "/etc/myapp/conf.d/{{ item.name }}.conf"
+    content: "{{ item.body }}"
+    worker: true
+  loop: "{{ fragments }}"
+
+# Привести дерево приложения к манифесту, содержимое уже в хранилище blob
+- name: Разложить релиз по манифесту
+  my_namespace.my_collection.my_own_module:
+    manifest: /var/cache/myapp/release-42.json
+    blob_placement: [ reflink, hardlink, copy ]
 '''
 
 RETURN = r'''
 path:
   description: Путь к файлу
   type: str
-  returned: always
+  returned: when path is used
   sample: '/tmp/test.txt'
 state:
   description: Состояние файла после выполнения
   type: str
-  returned: always
+  returned: when path is used
   sample: 'present'
 changed:
   description: Были ли внесены изменения
@@ -86,56 +477,434 @@ changed:
 size:
   description: Размер файла в байтах
   type: int
-  returned: when state=present
+  returned: when state=present or state=appended
   sample: 42
+written:
+  description:
+    - Сколько байт записано в файл; при O(state=appended) и O(ensure_lines)
+      это дописанные байты, а не весь размер файла
+  type: int
+  returned: when state=appended or ensure_lines is used
+  sample: 12
+lines_added:
+  description: Сколько строк из O(ensure_lines) дописано в файл
+  type: int
+  returned: when ensure_lines is used with state=present or state=appended
+  sample: 2
+lines_removed:
+  description: Сколько строк удалено из файла
+  type: int
+  returned: when ensure_lines is used with state=absent
+  sample: 1
 checksum:
-  description: SHA1 контрольная сумма файла
+  description: Контрольная сумма файла по алгоритму O(checksum_algorithm)
   type: str
   returned: when state=present
   sample: "a1b2c3d4e5f67890123456789012345678901234"
+results:
+  description:
+    - Результаты по каждому элементу O(files) в том же порядке
+    - Каждый элемент содержит те же ключи, что и результат для одного файла
+  type: list
+  elements: dict
+  returned: when files is used
+  sample: [{"path": "/etc/myapp/a.conf", "state": "present", "changed": true, "size": 6}]
+content_required:
+  description:
+    - Файл отличается от ожидаемого, и для его обновления нужно содержимое
+    - Используется action-плагином, который в этом случае повторяет вызов с O(content)
+  type: bool
+  returned: when the action plugin sent only the content checksum
+  sample: true
+placement:
+  description: Способ, которым содержимое размещено из хранилища blob
+  type: str
+  returned: when blob_store=true and the file was written
+  sample: reflink
+copy_method:
+  description:
+    - Способ копирования файла O(src) на хосте
+    - C(copy_file_range), C(sendfile) или C(buffered)
+  type: str
+  returned: when remote_src=true and the file was written
+  sample: copy_file_range
+summary:
+  description:
+    - Сводка по манифесту, число записей по каждому исходу
+    - C(created), C(updated) — файл создан или заменено содержимое, C(attributes) —
+      изменены только права или владелец, C(removed) — файл удалён
+  type: dict
+  returned: when manifest is used
+  sample: {"total": 12000, "created": 3, "updated": 1, "attributes": 0, "removed": 2, "unchanged": 11994}
+changed_files:
+  description: Пути из манифеста, которые были изменены
+  type: list
+  elements: str
+  returned: when manifest is used
+  sample: ["/srv/app/lib/a.py"]
+missing_content:
+  description: Пути из манифеста, содержимого которых нет в хранилище blob
+  type: list
+  elements: str
+  returned: when manifest is used and some blobs are missing
+  sample: ["/srv/app/lib/b.py"]
+removed_files:
+  description: Число удалённых файлов (в режиме проверки — подлежащих удалению)
+  type: int
+  returned: when state=absent and recurse or glob is used
+  sample: 182344
+removed_dirs:
+  description: Число удалённых каталогов
+  type: int
+  returned: when state=absent and recurse or glob is used
+  sample: 1207
+freed_bytes:
+  description: Суммарный размер удалённых обычных файлов в байтах
+  type: int
+  returned: when state=absent and recurse or glob is used
+  sample: 734003200
+mismatches:
+  description:
+    - Файлы, не совпавшие с ожидаемым состоянием, в порядке элементов
+    - C(reasons) перечисляет расхождения (C(missing), C(checksum), C(mode), C(owner),
+      C(group)), остальные ключи содержат фактические значения
+  type: list
+  elements: dict
+  returned: when state=verify
+  sample: [{"path": "/etc/myapp/a.conf", "reasons": ["mode"], "mode": "0600"}]
+verified:
+  description: Число проверенных файлов
+  type: int
+  returned: when state=verify
+  sample: 2
+delta_reused:
+  description: Сколько байт взято из прежнего содержимого файла при передаче дельтой
+  type: int
+  returned: when delta=true and the file was updated from a delta
+  sample: 52428800
+timings:
+  description:
+    - Замеры задачи по монотонным часам, в секундах
+    - C(total) — время выполнения задачи в модуле
+    - C(phases) — суммарное время, число вызовов и объём данных в байтах по фазам
+      C(stat), C(checksum), C(compare), C(scan), C(signatures), C(write), C(attributes),
+      C(remove); C(scan) — просмотр файла при O(state=appended) и O(ensure_lines)
+    - При O(parallelism) больше 1 время фаз суммируется по потокам
+    - Если action-плагин вызывал модуль дважды (проверка и передача содержимого),
+      замеры обоих вызовов сложены
+  type: dict
+  returned: when profile=true
+  sample: {"total": 0.0123, "phases": {"stat": {"seconds": 0.0001, "calls": 1, "bytes": 0},
+           "write": {"seconds": 0.0102, "calls": 1, "bytes": 1048576}}}
 '''
 
+import base64
+import functools
 import os
-import hashlib
+import stat
 import traceback
-from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
 from ansible.module_utils._text import to_bytes, to_native
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.atomic import (
+    DURABILITY_LEVELS, NO_SYNC, SyncPolicy, append_data, atomic_copy, atomic_write,
+    atomic_write_chunks, file_chunks)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.blob_store import (
+    BlobStore, DEFAULT_BLOB_STORE, PLACEMENT_METHODS, detach_link)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.checksum_cache import (
+    ChecksumCache, DEFAULT_CHECKSUM_CACHE, DEFAULT_MAX_ENTRIES)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.delta import (
+    DELTA_MIN_SIZE, apply_delta, block_signatures, delta_stats)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.manifest import (
+    load_manifest, sweep)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.profiling import (
+    NULL_TIMER, PhaseTimer, apply_profile_env)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.lines import (
+    ends_with, has_any_line, missing_lines, needs_newline, without_lines)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.remove import (
+    remove_paths)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.worker import (
+    DEFAULT_IDLE_TIMEOUT, call, default_socket_path, spawn)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.my_utils import (
+    CHECKSUM_ALGORITHMS, COMPRESSION_METHODS, HAS_XXHASH, XXHASH_ALGORITHMS, calculate_checksum,
+    decompress_chunks, file_checksum, mapped_windows, parallel_map)
+
+# Размер блока для потокового сравнения файлов
+CHUNK_SIZE = 64 * 1024
+# Содержимое больше этого размера action-плагин передаёт сжатым
+DEFAULT_COMPRESSION_THRESHOLD = 64 * 1024
 
-def get_file_checksum(path):
-    """Вычисляет SHA1 контрольную сумму файла."""
+
+def get_file_checksum(path, algorithm='sha1'):
+    """Вычисляет контрольную сумму файла."""
     try:
-        with open(path, 'rb') as f:
-            file_hash = hashlib.sha1()
-            while chunk := f.read(8192):
-                file_hash.update(chunk)
-        return file_hash.hexdigest()
+        return file_checksum(path, algorithm, CHUNK_SIZE)
     except Exception as e:
         return None
 
-def main():
-    # Определяем параметры модуля
-    module_args = dict(
-        state=dict(type='str', default='present', choices=['present', 'absent']),
-        path=dict(type='path', required=True),
-        content=dict(type='str', default=''),
-        mode=dict(type='str'),
-        owner=dict(type='str'),
-        group=dict(type='str'),
-    )
 
-    # Создаём объект модуля
-    module = AnsibleModule(
-        argument_spec=module_args,
-        supports_check_mode=True
-    )
+def file_matches(path, data, chunk_size=CHUNK_SIZE):
+    """Сравнивает файл с байтами data до первого отличия.
+
+    Большой файл сравнивается окнами mmap без копирования, остальные читаются
+    частями в один буфер. bytes.startswith сравнивает через memcmp,
+    в отличие от поэлементного сравнения memoryview.
+    """
+    with open(path, 'rb', buffering=0) as f:
+        windows = mapped_windows(f)
+        offset = 0
+        if windows is not None:
+            for view in windows:
+                if not data.startswith(view, offset):
+                    return False
+                offset += len(view)
+            return offset == len(data)
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while n := f.readinto(buf):
+            if not data.startswith(view[:n], offset):
+                return False
+            offset += n
+    return offset == len(data)
+
+
+def content_bytes(params):
+    """Возвращает желаемое содержимое в байтах: из content_base64 или content в encoding."""
+    if params.get('content_base64') is not None:
+        return base64.b64decode(params['content_base64'], validate=True)
+    return to_bytes(params.get('content') or '', encoding=params.get('encoding') or 'utf-8',
+                    errors='surrogate_or_strict')
+
+
+def content_matches(path, st, checksum, size, data=None, cache=None, algorithm='sha1',
+                    timer=NULL_TIMER):
+    """Проверяет, что файл с метаданными st имеет заданный размер и контрольную сумму.
+
+    Если в кеше есть сумма для неизменённого файла, файл не читается.
+    Иначе он сравнивается с data по частям, а без data — хешируется.
+    """
+    if st.st_size != size:
+        return False
+    if cache is not None:
+        cached = cache.get(st, algorithm)
+        if cached is not None:
+            return cached == checksum
+    if data is None:
+        with timer.phase('checksum', st.st_size):
+            current = get_file_checksum(path, algorithm)
+        matches = current == checksum
+    else:
+        current = checksum
+        with timer.phase('compare', st.st_size):
+            matches = file_matches(path, data)
+    if cache is not None and current is not None and (matches or data is None):
+        cache.put(st, current, algorithm)
+    return matches
+
+
+@functools.lru_cache(maxsize=None)
+def lookup_uid(owner):
+    """Возвращает uid по имени пользователя (запоминается на время работы процесса)."""
+    import pwd
+    return pwd.getpwnam(owner).pw_uid
+
+
+@functools.lru_cache(maxsize=None)
+def lookup_gid(group):
+    """Возвращает gid по имени группы (запоминается на время работы процесса)."""
+    import grp
+    return grp.getgrnam(group).gr_gid
+
+
+def resolve_ids(owner, group):
+    """Возвращает uid и gid по именам владельца и группы (-1, если не заданы)."""
+    uid = lookup_uid(owner) if owner else -1
+    gid = lookup_gid(group) if group else -1
+    return uid, gid
+
+
+def stat_target(path):
+    """Возвращает путь, в который нужно писать, и его stat (None, если файла нет).
+
+    Обычный файл обходится одним lstat; символическая ссылка разыменовывается,
+    чтобы обновлять файл, на который она указывает, а не заменять саму ссылку.
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return path, None
+    if stat.S_ISLNK(st.st_mode):
+        path = os.path.realpath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return path, None
+    return path, st
+
+
+class RunContext:
+    """Общие для всех файлов настройки одного запуска модуля."""
+
+    def __init__(self, check_mode=False, store=None, cache=None, algorithm='sha1',
+                 sync=NO_SYNC, delta=False, delta_block_size=None, parallelism=1,
+                 timer=NULL_TIMER, blob_root=DEFAULT_BLOB_STORE):
+        self.check_mode = check_mode
+        self.store = store
+        self.blob_root = blob_root
+        self.cache = cache
+        self.algorithm = algorithm
+        self.sync = sync
+        self.delta = delta
+        self.delta_block_size = delta_block_size
+        self.parallelism = parallelism
+        self.timer = timer
+        self.warnings = []
+
+    def finish(self):
+        """Сохраняет кеш и выполняет отложенный сброс на диск.
+
+        Кеш — лишь ускорение: если его не удалось сохранить (например, у
+        непривилегированного пользователя нет доступа к /var/cache), файлы уже
+        изменены, и задача не проваливается, а получает предупреждение.
+        """
+        if self.cache is not None and self.cache.dirty:
+            try:
+                self.cache.save()
+            except OSError as e:
+                self.warnings.append(f"Не удалось сохранить кеш контрольных сумм "
+                                     f"{self.cache.path}: {to_native(e)}")
+        self.sync.finish()
 
-    # Получаем параметры
-    state = module.params['state']
-    path = module.params['path']
-    content = module.params['content']
-    mode = module.params['mode']
-    owner = module.params['owner']
-    group = module.params['group']
+    def shares_blob(self, st, digest=None):
+        """Проверяет, что файл — жёсткая ссылка на blob хранилища.
+
+        Такой inode нельзя менять на месте: изменился бы сам blob и все файлы,
+        размещённые из него, в том числе задачами с blob_store: true. Другие
+        жёсткие ссылки — дело пользователя, и они не разрываются.
+        """
+        if st.st_nlink <= 1:
+            return False
+        store = self.store if self.store is not None else BlobStore(self.blob_root)
+        return store.contains(st, digest)
+
+    def report(self, result):
+        """Добавляет к результату накопленные предупреждения."""
+        if self.warnings:
+            result['warnings'] = result.get('warnings', []) + self.warnings
+        return result
+
+
+def encoded_lines(params):
+    """Возвращает строки ensure_lines без повторов в байтах в кодировке encoding."""
+    lines = []
+    for line in params['ensure_lines']:
+        data = to_bytes(line, encoding=params.get('encoding') or 'utf-8',
+                        errors='surrogate_or_strict')
+        if b'\n' in data:
+            raise ValueError(f"Строка ensure_lines содержит перевод строки: {line!r}")
+        lines.append(data)
+    return list(dict.fromkeys(lines))
+
+
+def edit_file(params, ctx):
+    """Дописывает или удаляет данные в файле, не переписывая его без необходимости.
+
+    state=appended дописывает content, если файл им ещё не заканчивается.
+    ensure_lines дописывает недостающие строки, а при state=absent удаляет
+    их атомарной перезаписью файла. Файл просматривается потоково один раз.
+    """
+    check_mode = ctx.check_mode
+    timer = ctx.timer
+    state = params['state']
+    path = params['path']
+    result = dict(changed=False, path=path, state=state)
+
+    with timer.phase('stat'):
+        target, st = stat_target(path)
+        uid, gid = resolve_ids(params['owner'], params['group'])
+    mode_value = int(params['mode'], 8) if params['mode'] else None
+
+    if params.get('ensure_lines') is not None and state == 'absent':
+        lines = encoded_lines(params)
+        if st is None:
+            result['lines_removed'] = 0
+            return result
+        with timer.phase('scan', st.st_size):
+            found = has_any_line(target, lines)
+        removed = []
+        if found:
+            with timer.phase('write', st.st_size):
+                if check_mode:
+                    for piece in without_lines(target, lines, removed):
+                        pass
+                else:
+                    atomic_write_chunks(target, without_lines(target, lines, removed), ctx.sync,
+                                        ctx.algorithm)
+        result['changed'] = bool(removed)
+        result['lines_removed'] = len(removed)
+        result['size'] = st.st_size - sum(len(line) for line in removed)
+        result['written'] = result['size'] if removed else 0
+        return result
+
+    if params.get('ensure_lines') is not None:
+        lines = encoded_lines(params)
+        missing = lines
+        if st is not None:
+            with timer.phase('scan', st.st_size):
+                missing = missing_lines(target, lines)
+        data = b''.join(line + b'\n' for line in missing)
+        if data and st is not None and needs_newline(target):
+            data = b'\n' + data
+        result['lines_added'] = len(missing)
+    else:
+        data = content_bytes(params)
+        if data and st is not None:
+            with timer.phase('scan', len(data)):
+                if ends_with(target, data):
+                    data = b''
+
+    if st is None:
+        attrs_changed = False
+    else:
+        attrs_changed = ((mode_value is not None and stat.S_IMODE(st.st_mode) != mode_value)
+                         or (uid != -1 and st.st_uid != uid)
+                         or (gid != -1 and st.st_gid != gid))
+    content_changed = bool(data) or st is None
+
+    if not check_mode and (content_changed or attrs_changed):
+        if st is not None and ctx.shares_blob(st):
+            # Дописывание и chmod изменили бы сам blob
+            with timer.phase('attributes'):
+                detach_link(target, ctx.sync)
+        if content_changed:
+            with timer.phase('write', len(data)):
+                dir_path = os.path.dirname(target)
+                if dir_path and not os.path.exists(dir_path):
+                    os.makedirs(dir_path, exist_ok=True)
+                append_data(target, data, ctx.sync)
+        with timer.phase('attributes'):
+            if mode_value is not None:
+                os.chmod(target, mode_value)
+            if uid != -1 or gid != -1:
+                os.chown(target, uid, gid)
+
+    result['changed'] = content_changed or attrs_changed
+    result['size'] = (0 if st is None else st.st_size) + len(data)
+    result['written'] = len(data)
+    return result
+
+
+def manage_file(params, ctx):
+    """Приводит один файл к требуемому состоянию и возвращает результат."""
+    if params['state'] == 'appended' or params.get('ensure_lines') is not None:
+        return edit_file(params, ctx)
+    check_mode = ctx.check_mode
+    store = ctx.store
+    timer = ctx.timer
+    state = params['state']
+    path = params['path']
+    mode = params['mode']
+    owner = params['owner']
+    group = params['group']
 
     result = dict(
         changed=False,
@@ -143,93 +912,639 @@ def main():
         state=state
     )
 
-    file_exists = os.path.exists(path)
-
-    try:
-        if state == 'absent':
-            # Удаление файла
-            if file_exists:
-                if not module.check_mode:
+    if state == 'absent':
+        if (params.get('recurse') or params.get('glob')
+                or (os.path.isdir(path) and not os.path.islink(path))):
+            # Каталоги и шаблоны: возвращаются счётчики вместо списка файлов
+            with timer.phase('remove'):
+                removed = remove_paths(path, params.get('recurse'), ctx.sync, ctx.parallelism,
+                                       check_mode, params.get('glob'))
+            result.update(removed)
+            result['changed'] = removed['removed_files'] + removed['removed_dirs'] > 0
+            return result
+        # Удаление файла
+        with timer.phase('remove'):
+            if os.path.lexists(path):
+                if not check_mode:
                     os.remove(path)
+                    ctx.sync.sync_entry(path)
                 result['changed'] = True
-                module.exit_json(**result)
-            else:
-                module.exit_json(**result)
-
-        elif state == 'present':
-            # Создание/обновление файла
-            if file_exists:
-                # Читаем текущее содержимое
-                with open(path, 'r') as f:
-                    current_content = f.read()
-                
-                # Проверяем, нужно ли обновлять
-                content_changed = current_content != content
-                needs_change = content_changed
-                
-                # Проверяем права доступа
-                if mode:
-                    current_mode = oct(os.stat(path).st_mode & 0o777)[2:]
-                    needs_change = needs_change or (current_mode != mode)
-                
-                if needs_change:
-                    if not module.check_mode:
-                        # Обновляем файл
-                        with open(path, 'w') as f:
-                            f.write(content)
-                        
-                        # Устанавливаем права доступа
-                        if mode:
-                            os.chmod(path, int(mode, 8))
-                        
-                        # Устанавливаем владельца/группу
-                        if owner or group:
-                            import pwd
-                            import grp
-                            uid = pwd.getpwnam(owner).pw_uid if owner else -1
-                            gid = grp.getgrnam(group).gr_gid if group else -1
-                            os.chown(path, uid, gid)
-                    
-                    result['changed'] = True
-                    result['size'] = len(content)
-                    result['checksum'] = get_file_checksum(path)
-                    module.exit_json(**result)
+        return result
+
+    # Создание/обновление файла
+    src = params.get('src')
+    compressed = params.get('_content_compressed')
+    delta_ops = params.get('_delta_ops')
+    expected_checksum = params.get('_content_checksum')
+    # stream возвращает итератор блоков содержимого, если оно не в памяти целиком
+    stream = None
+    if delta_ops is not None:
+        # Новое содержимое собирается из блоков текущего файла и присланных данных
+        data = None
+        checksum = expected_checksum
+        size = params['_content_size']
+
+        def stream():
+            return apply_delta(target, delta_ops, params['_delta_block_size'], CHUNK_SIZE)
+    elif compressed is not None:
+        # Сжатое содержимое распаковывается блоками прямо при записи
+        data = None
+        checksum = expected_checksum
+        size = params['_content_size']
+
+        def stream():
+            return decompress_chunks(compressed, params['_content_encoding'], CHUNK_SIZE)
+    elif src is not None:
+        # Содержимое берётся из файла на хосте и читается только потоково.
+        # Без суммы от action-плагина это исходный файл на хосте (remote_src),
+        # и без хранилища его копирует ядро, см. atomic_copy
+        data = None
+
+        def stream():
+            return file_chunks(src, CHUNK_SIZE)
+
+        if expected_checksum is None:
+            size = os.stat(src).st_size
+            with timer.phase('checksum', size):
+                checksum = file_checksum(src, ctx.algorithm, CHUNK_SIZE)
+        else:
+            checksum = expected_checksum
+            size = params['_content_size']
+    elif expected_checksum is None:
+        data = content_bytes(params)
+        with timer.phase('checksum', len(data)):
+            checksum = calculate_checksum(data, ctx.algorithm, CHUNK_SIZE)
+        size = len(data)
+    else:
+        # Action-плагин прислал контрольную сумму, вычисленную на контроллере,
+        # и содержимое, если оно нужно для обновления
+        checksum = expected_checksum
+        size = params['_content_size']
+        data = content_bytes(params)
+        if len(data) != size:
+            # Только сумма: содержимое придёт повторным вызовом
+            data = None
+
+    # Один lstat на путь: размер, права и владелец сравниваются без чтения файла
+    with timer.phase('stat'):
+        target, st = stat_target(path)
+        uid, gid = resolve_ids(owner, group)
+    file_exists = st is not None
+    mode_value = int(mode, 8) if mode else None
+
+    if file_exists:
+        # Содержимое сравнивается, только если совпадает размер
+        content_changed = not content_matches(target, st, checksum,
+                                              size if data is None else len(data),
+                                              data, ctx.cache, ctx.algorithm, timer)
+        attrs_changed = ((mode_value is not None and stat.S_IMODE(st.st_mode) != mode_value)
+                         or (uid != -1 and st.st_uid != uid)
+                         or (gid != -1 and st.st_gid != gid))
+    else:
+        content_changed = True
+        attrs_changed = False
+
+    from_store = store is not None and store.has(checksum)
+    if content_changed and data is None and stream is None and not from_store and not check_mode:
+        # Для обновления нужно само содержимое
+        result['content_required'] = True
+        if ctx.delta and file_exists and st.st_size >= DELTA_MIN_SIZE:
+            # По суммам блоков action-плагин сможет прислать только изменения
+            with timer.phase('signatures', st.st_size):
+                result['delta_signatures'] = block_signatures(target, ctx.delta_block_size)
+        return result
+
+    needs_change = content_changed or attrs_changed
+
+    if needs_change and not check_mode:
+        if content_changed:
+            with timer.phase('write', size):
+                # Создаём директорию если её нет
+                dir_path = os.path.dirname(target)
+                if dir_path and not os.path.exists(dir_path):
+                    os.makedirs(dir_path, exist_ok=True)
+
+                if store is not None:
+                    # Содержимое пишется в хранилище один раз, а в path размещается из него
+                    if from_store:
+                        pass
+                    elif stream is not None:
+                        store.add_chunks(checksum, stream(), ctx.algorithm)
+                    else:
+                        store.add(checksum, data)
+                    result['placement'] = store.place(checksum, target, mode_value, uid, gid)
+                elif src is not None and expected_checksum is None:
+                    result['copy_method'] = atomic_copy(src, target, ctx.sync)
+                elif stream is not None:
+                    atomic_write_chunks(target, stream(), ctx.sync, ctx.algorithm, checksum)
                 else:
-                    result['size'] = len(current_content)
-                    result['checksum'] = get_file_checksum(path)
-                    module.exit_json(**result)
-            else:
-                # Создаём новый файл
-                if not module.check_mode:
-                    # Создаём директорию если её нет
-                    dir_path = os.path.dirname(path)
-                    if dir_path and not os.path.exists(dir_path):
-                        os.makedirs(dir_path, exist_ok=True)
-                    
-                    # Создаём файл
-                    with open(path, 'w') as f:
-                        f.write(content)
-                    
-                    # Устанавливаем права доступа
-                    if mode:
-                        os.chmod(path, int(mode, 8))
-                    
-                    # Устанавливаем владельца/группу
-                    if owner or group:
-                        import pwd
-                        import grp
-                        uid = pwd.getpwnam(owner).pw_uid if owner else -1
-                        gid = grp.getgrnam(group).gr_gid if group else -1
-                        os.chown(path, uid, gid)
-                
-                result['changed'] = True
-                result['size'] = len(content)
-                result['checksum'] = get_file_checksum(path) if not module.check_mode else None
-                module.exit_json(**result)
+                    atomic_write(target, data, ctx.sync)
+
+        with timer.phase('attributes'):
+            if not content_changed and ctx.shares_blob(st, checksum):
+                # Не меняем права у общего с хранилищем inode, даже если файл
+                # размещён из хранилища другой задачей
+                detach_link(target, ctx.sync)
+
+            # Устанавливаем права доступа
+            if mode_value is not None:
+                os.chmod(target, mode_value)
+
+            # Устанавливаем владельца/группу
+            if uid != -1 or gid != -1:
+                os.chown(target, uid, gid)
+
+    if delta_ops is not None and content_changed and not check_mode:
+        result['delta_reused'] = delta_stats(delta_ops, params['_delta_block_size'])
+    result['changed'] = needs_change
+    result['size'] = size
+    result['checksum'] = checksum if file_exists or not check_mode else None
+    return result
+
+
+def merge_item(item, defaults, payloads=()):
+    """Дополняет элемент списка files значениями параметров верхнего уровня.
+
+    Содержимое, общее для нескольких элементов, берётся из payloads по индексу _payload.
+    """
+    if item.get('_payload') is not None:
+        item = dict(item, **payloads[item['_payload']])
+    params = dict(defaults)
+    if any(item.get(key) is not None
+           for key in ('content', 'content_base64', 'src', 'ensure_lines', 'checksum',
+                       '_content_compressed', '_delta_ops')):
+        # Источник содержимого элемента заменяет источник верхнего уровня
+        for key in ('content', 'content_base64', 'src', 'ensure_lines', 'checksum',
+                    '_content_checksum', '_content_size',
+                    '_content_compressed', '_content_encoding', '_delta_ops',
+                    '_delta_block_size'):
+            params.pop(key, None)
+    for key, value in item.items():
+        if value is not None:
+            params[key] = value
+    params.setdefault('content', '')
+    return params
+
+
+def cached_checksum(path, st, cache=None, algorithm='sha1', timer=NULL_TIMER):
+    """Возвращает контрольную сумму файла, по возможности из кеша."""
+    if cache is not None:
+        cached = cache.get(st, algorithm)
+        if cached is not None:
+            return cached
+    with timer.phase('checksum', st.st_size):
+        checksum = get_file_checksum(path, algorithm)
+    if cache is not None and checksum is not None:
+        cache.put(st, checksum, algorithm)
+    return checksum
+
+
+def verify_file(params, ctx):
+    """Сравнивает файл с ожидаемым состоянием и возвращает расхождение или None.
+
+    Файл хешируется, только если совпал его размер (когда он известен),
+    поэтому память на поток ограничена буфером чтения.
+    """
+    path = params['path']
+    expected_checksum = params.get('checksum') or params.get('_content_checksum')
+    if expected_checksum is None and params.get('src') is not None:
+        # Эталон — файл src на хосте (remote_src)
+        expected_checksum = file_checksum(params['src'], ctx.algorithm, CHUNK_SIZE)
+        params = dict(params, _content_size=os.stat(params['src']).st_size)
+    elif expected_checksum is None and (params.get('content') or params.get('content_base64')):
+        expected_checksum = calculate_checksum(content_bytes(params), ctx.algorithm)
+    with ctx.timer.phase('stat'):
+        target, st = stat_target(path)
+    if st is None:
+        return dict(path=path, reasons=['missing'])
+
+    mismatch = dict(path=path, reasons=[])
+    if expected_checksum is not None:
+        size = params.get('_content_size')
+        if size is not None and st.st_size != size:
+            mismatch['reasons'].append('checksum')
+            mismatch['size'] = st.st_size
+        else:
+            checksum = cached_checksum(target, st, ctx.cache, ctx.algorithm, ctx.timer)
+            if checksum != expected_checksum:
+                mismatch['reasons'].append('checksum')
+                mismatch['checksum'] = checksum
+    if params.get('mode') and stat.S_IMODE(st.st_mode) != int(params['mode'], 8):
+        mismatch['reasons'].append('mode')
+        mismatch['mode'] = f"{stat.S_IMODE(st.st_mode):04o}"
+    uid, gid = resolve_ids(params.get('owner'), params.get('group'))
+    if uid != -1 and st.st_uid != uid:
+        mismatch['reasons'].append('owner')
+        mismatch['uid'] = st.st_uid
+    if gid != -1 and st.st_gid != gid:
+        mismatch['reasons'].append('group')
+        mismatch['gid'] = st.st_gid
+    return mismatch if mismatch['reasons'] else None
+
+
+def verify_files(items, ctx):
+    """Проверяет файлы параллельно и возвращает только расхождения."""
+    def process(params):
+        try:
+            return verify_file(params, ctx)
+        except Exception as e:
+            return dict(path=params['path'], reasons=['error'], msg=to_native(e))
+
+    return [m for m in parallel_map(process, items, ctx.parallelism) if m is not None]
+
+
+def apply_manifest_entry(entry, target, st, ctx):
+    """Приводит файл к записи манифеста и возвращает исход для сводки."""
+    path = entry['path']
+    if entry['state'] == 'absent':
+        if st is None and not os.path.lexists(path):
+            return 'unchanged'
+        if not ctx.check_mode:
+            os.remove(path)
+            ctx.sync.sync_entry(path)
+        return 'removed'
+
+    checksum = entry['checksum']
+    uid, gid = resolve_ids(entry.get('owner'), entry.get('group'))
+    mode_value = entry['mode']
+
+    if st is None:
+        outcome = 'created'
+    elif entry.get('size') is not None and st.st_size != entry['size']:
+        outcome = 'updated'
+    elif cached_checksum(target, st, ctx.cache, ctx.algorithm, ctx.timer) != checksum:
+        outcome = 'updated'
+    elif ((mode_value is not None and stat.S_IMODE(st.st_mode) != mode_value)
+          or (uid != -1 and st.st_uid != uid)
+          or (gid != -1 and st.st_gid != gid)):
+        outcome = 'attributes'
+    else:
+        return 'unchanged'
+
+    if outcome != 'attributes' and not ctx.store.has(checksum):
+        return 'missing'
+
+    if not ctx.check_mode:
+        if outcome == 'attributes':
+            if ctx.shares_blob(st, checksum):
+                # Не меняем права у общего с хранилищем inode
+                detach_link(target, ctx.sync)
+        else:
+            dir_path = os.path.dirname(target)
+            if dir_path and not os.path.exists(dir_path):
+                os.makedirs(dir_path, exist_ok=True)
+            ctx.store.place(checksum, target, mode_value, uid, gid)
+        if mode_value is not None:
+            os.chmod(target, mode_value)
+        if uid != -1 or gid != -1:
+            os.chown(target, uid, gid)
+    return outcome
+
+
+def apply_manifest(manifest_path, ctx):
+    """Приводит файлы к манифесту и возвращает сводку изменений и ошибки."""
+    entries = load_manifest(manifest_path)
+    with ctx.timer.phase('stat'):
+        stats = sweep(entries, ctx.parallelism)
+
+    def process(entry):
+        target, st = stats[entry['path']]
+        try:
+            return apply_manifest_entry(entry, target, st, ctx), None
+        except Exception as e:
+            return 'failed', f"{entry['path']}: {to_native(e)}"
+
+    summary = dict(total=len(entries), created=0, updated=0, attributes=0, removed=0,
+                   unchanged=0)
+    changed_files = []
+    missing = []
+    failed = []
+    for entry, (outcome, error) in zip(entries, parallel_map(process, entries, ctx.parallelism)):
+        if outcome == 'failed':
+            failed.append(error)
+        elif outcome == 'missing':
+            missing.append(entry['path'])
+        else:
+            summary[outcome] += 1
+            if outcome != 'unchanged':
+                changed_files.append(entry['path'])
 
+    result = dict(
+        changed=bool(changed_files),
+        summary=summary,
+        changed_files=changed_files,
+    )
+    if missing:
+        result['missing_content'] = missing
+    return result, failed
+
+
+def process_items(items, ctx):
+    """Обрабатывает элементы пакета и возвращает результаты в их порядке.
+
+    Элементы с одним путём попадают в одну группу и выполняются по порядку,
+    разные группы — параллельно в ctx.parallelism потоках.
+    """
+    groups = {}
+    for index, params in enumerate(items):
+        groups.setdefault(os.path.normpath(params['path']), []).append((index, params))
+
+    def process_group(group):
+        group_results = []
+        for index, params in group:
+            try:
+                item_result = manage_file(params, ctx)
+            except Exception as e:
+                item_result = dict(
+                    changed=False,
+                    failed=True,
+                    path=params['path'],
+                    state=params['state'],
+                    msg=f"Ошибка: {to_native(e)}",
+                )
+            group_results.append((index, item_result))
+        return group_results
+
+    results = [None] * len(items)
+    for group_results in parallel_map(process_group, groups.values(), ctx.parallelism):
+        for index, item_result in group_results:
+            results[index] = item_result
+    return results
+
+
+def argument_spec():
+    """Возвращает описание параметров модуля (общее для модуля и обработчика)."""
+    file_options = dict(
+        state=dict(type='str', choices=['present', 'absent', 'verify', 'appended']),
+        path=dict(type='path', required=True),
+        content=dict(type='str'),
+        content_base64=dict(type='str'),
+        encoding=dict(type='str'),
+        src=dict(type='path'),
+        remote_src=dict(type='bool'),
+        ensure_lines=dict(type='list', elements='str'),
+        checksum=dict(type='str'),
+        recurse=dict(type='bool'),
+        glob=dict(type='bool'),
+        mode=dict(type='str'),
+        owner=dict(type='str'),
+        group=dict(type='str'),
+        _content_checksum=dict(type='str'),
+        _content_size=dict(type='int'),
+        _content_compressed=dict(type='str'),
+        _content_encoding=dict(type='str', choices=list(COMPRESSION_METHODS)),
+        _delta_ops=dict(type='list', elements='raw'),
+        _delta_block_size=dict(type='int'),
+        _payload=dict(type='int'),
+    )
+    return dict(
+        state=dict(type='str', default='present',
+                   choices=['present', 'absent', 'verify', 'appended']),
+        path=dict(type='path'),
+        content=dict(type='str', default=''),
+        content_base64=dict(type='str'),
+        encoding=dict(type='str', default='utf-8'),
+        src=dict(type='path'),
+        remote_src=dict(type='bool', default=False),
+        ensure_lines=dict(type='list', elements='str'),
+        checksum=dict(type='str'),
+        recurse=dict(type='bool', default=False),
+        glob=dict(type='bool', default=False),
+        mode=dict(type='str'),
+        owner=dict(type='str'),
+        group=dict(type='str'),
+        files=dict(type='list', elements='dict', options=file_options,
+                   mutually_exclusive=[('content', 'content_base64', 'src', 'ensure_lines')]),
+        blob_store=dict(type='bool', default=False),
+        blob_store_path=dict(type='path', default=DEFAULT_BLOB_STORE),
+        blob_placement=dict(type='list', elements='str', choices=list(PLACEMENT_METHODS),
+                            default=list(PLACEMENT_METHODS)),
+        checksum_algorithm=dict(type='str', default='sha1', choices=list(CHECKSUM_ALGORITHMS)),
+        checksum_cache=dict(type='bool', default=False),
+        checksum_cache_path=dict(type='path', default=DEFAULT_CHECKSUM_CACHE),
+        checksum_cache_size=dict(type='int', default=DEFAULT_MAX_ENTRIES),
+        durability=dict(type='str', default='none', choices=list(DURABILITY_LEVELS)),
+        content_compression=dict(type='str', default='auto',
+                                 choices=['auto', 'none'] + list(COMPRESSION_METHODS)),
+        content_compression_threshold=dict(type='int', default=DEFAULT_COMPRESSION_THRESHOLD),
+        manifest=dict(type='path'),
+        parallelism=dict(type='int', default=1),
+        delta=dict(type='bool', default=False),
+        delta_block_size=dict(type='int'),
+        worker=dict(type='bool', default=False),
+        worker_socket=dict(type='path'),
+        worker_idle_timeout=dict(type='int', default=DEFAULT_IDLE_TIMEOUT),
+        profile=dict(type='bool', default=False),
+        profile_output=dict(type='path'),
+        _content_checksum=dict(type='str'),
+        _content_size=dict(type='int'),
+        _content_compressed=dict(type='str'),
+        _content_encoding=dict(type='str', choices=list(COMPRESSION_METHODS)),
+        _delta_ops=dict(type='list', elements='raw'),
+        _delta_block_size=dict(type='int'),
+        _worker_version=dict(type='str'),
+        _payloads=dict(type='list', elements='dict'),
+    )
+
+
+MUTUALLY_EXCLUSIVE = [('path', 'files', 'manifest'),
+                      ('content', 'content_base64', 'src', 'ensure_lines')]
+REQUIRED_ONE_OF = [('path', 'files', 'manifest')]
+# Строки длиннее этого не повторяются в invocation.module_args результата
+INVOCATION_VALUE_LIMIT = 4096
+
+
+def invocation_args(value):
+    """Параметры для invocation.module_args без тела содержимого.
+
+    AnsibleModule по умолчанию возвращает все параметры, и content в несколько
+    мегабайт ещё раз сериализовался бы в результат; длинные строки заменяются
+    их длиной.
+    """
+    if isinstance(value, str) and len(value) > INVOCATION_VALUE_LIMIT:
+        return f"<{len(value)} символов>"
+    if isinstance(value, dict):
+        return dict((key, invocation_args(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [invocation_args(item) for item in value]
+    return value
+
+
+def error_result(e, **result):
+    """Результат задачи, завершившейся исключением."""
+    result.update(failed=True, msg=f"Ошибка: {to_native(e)}", exception=traceback.format_exc())
+    return result
+
+
+def run(params, check_mode=False):
+    """Выполняет задачу с проверенными параметрами и возвращает её результат.
+
+    Ошибка задачи возвращается в результате с failed=True, а не исключением,
+    чтобы результат одинаково передавался из модуля и из обработчика.
+    С profile к результату добавляются замеры по фазам, с profile_output
+    задача выполняется под cProfile.
+    """
+    timer = PhaseTimer() if params['profile'] else NULL_TIMER
+    if not params['profile_output']:
+        result = execute(params, check_mode, timer)
+    else:
+        # Импорт только здесь: без profile_output профилирование ничего не стоит
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            result = execute(params, check_mode, timer)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(params['profile_output'])
+    if timer is not NULL_TIMER:
+        result['timings'] = timer.as_dict()
+    return result
+
+
+def execute(params, check_mode, timer):
+    """Выполняет задачу; timer собирает замеры по фазам."""
+    files = params['files']
+    if params['parallelism'] < 1:
+        return dict(failed=True, msg="parallelism должен быть не меньше 1")
+    algorithm = params['checksum_algorithm']
+    if algorithm in XXHASH_ALGORITHMS:
+        if not HAS_XXHASH:
+            return dict(failed=True, msg=missing_required_lib('xxhash'))
+        if params['blob_store'] or params['manifest']:
+            return dict(failed=True, msg=f"Алгоритм {algorithm} не стойкий к коллизиям "
+                                         "и не подходит для хранилища blob")
+
+    sync = SyncPolicy(params['durability'])
+    store = None
+    if params['blob_store'] or params['manifest']:
+        store = BlobStore(params['blob_store_path'], params['blob_placement'], sync)
+    cache = None
+    if params['checksum_cache']:
+        cache = ChecksumCache(params['checksum_cache_path'], params['checksum_cache_size'])
+    ctx = RunContext(check_mode, store, cache, algorithm, sync, params['delta'],
+                     params['delta_block_size'], params['parallelism'], timer,
+                     params['blob_store_path'])
+
+    if params['manifest']:
+        # Манифест: весь набор файлов за один проход
+        try:
+            result, failed = apply_manifest(params['manifest'], ctx)
+            ctx.finish()
+        except Exception as e:
+            return error_result(e)
+        if failed:
+            result.update(failed=True, msg=f"Ошибка при обработке файлов: {'; '.join(failed)}")
+        elif 'missing_content' in result:
+            result.update(failed=True, msg="Нет содержимого в хранилище blob для "
+                                           f"{len(result['missing_content'])} файлов манифеста")
+        return ctx.report(result)
+
+    verify = params['state'] == 'verify'
+    if files is not None and any(
+            item['state'] is not None and (item['state'] == 'verify') != verify for item in files):
+        return dict(failed=True, msg="state=verify нельзя сочетать с другими состояниями в files")
+    file_options = argument_spec()['files']['options']
+    defaults = dict((key, params[key]) for key in file_options if key not in ('path', '_payload'))
+
+    if verify:
+        # Аудит: файлы только читаются, возвращаются лишь расхождения
+        items = [params] if files is None else [merge_item(item, defaults) for item in files]
+        mismatches = verify_files(items, ctx)
+        try:
+            ctx.finish()
+        except Exception as e:
+            return error_result(e)
+        return ctx.report(dict(changed=False, verified=len(items), mismatches=mismatches))
+
+    if files is None:
+        # Один файл
+        try:
+            result = manage_file(params, ctx)
+            ctx.finish()
+        except Exception as e:
+            return error_result(e)
+        return ctx.report(result)
+
+    # Пакетный режим: все файлы за один запуск модуля
+    payloads = params.get('_payloads') or []
+    results = process_items([merge_item(item, defaults, payloads) for item in files], ctx)
+    failed = [r['path'] for r in results if r.get('failed')]
+
+    try:
+        ctx.finish()
     except Exception as e:
-        module.fail_json(msg=f"Ошибка: {to_native(e)}", 
-                         exception=traceback.format_exc())
+        return error_result(e)
+
+    result = dict(
+        changed=any(r['changed'] for r in results),
+        results=results,
+    )
+    if any(r.get('content_required') for r in results):
+        result['content_required'] = True
+    if failed:
+        result.update(failed=True, msg=f"Ошибка при обработке файлов: {', '.join(failed)}")
+    return ctx.report(result)
+
+
+def handle_worker_request(request):
+    """Выполняет задачу, присланную обработчику.
+
+    Аргументы от модуля уже проверены, аргументы от action-плагина
+    проверяются здесь так же, как это сделал бы AnsibleModule.
+    """
+    # Обработчик живёт долго: пользователей и группы могли переименовать или пересоздать
+    lookup_uid.cache_clear()
+    lookup_gid.cache_clear()
+    params = request['args']
+    if not request.get('validated'):
+        # ArgumentSpecValidator есть только в ansible-core 2.11+, а без worker модуль
+        # должен работать и на старых версиях
+        from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+        validator = ArgumentSpecValidator(argument_spec(), mutually_exclusive=MUTUALLY_EXCLUSIVE,
+                                          required_one_of=REQUIRED_ONE_OF)
+        validation = validator.validate(params)
+        if validation.error_messages:
+            return dict(failed=True, msg='; '.join(validation.error_messages))
+        params = validation.validated_parameters
+    return run(params, request.get('check_mode', False))
+
+
+def main():
+    # Создаём объект модуля
+    module = AnsibleModule(
+        argument_spec=argument_spec(),
+        mutually_exclusive=MUTUALLY_EXCLUSIVE,
+        required_one_of=REQUIRED_ONE_OF,
+        supports_check_mode=True
+    )
+
+    # Переменные окружения задачи действуют и при передаче её обработчику
+    apply_profile_env(module.params)
+    version = module.params['_worker_version']
+    if module.params['worker'] and version:
+        # Задача передаётся постоянному обработчику; если его нет или он
+        # другой версии, запускается новый, а задача выполняется здесь
+        socket_path = module.params['worker_socket'] or default_socket_path()
+        try:
+            result = call(socket_path, version, module.params, module.check_mode, validated=True)
+        except (OSError, ValueError):
+            try:
+                spawn(socket_path, version, handle_worker_request,
+                      module.params['worker_idle_timeout'])
+            except OSError:
+                pass
+            result = run(module.params, module.check_mode)
+    else:
+        result = run(module.params, module.check_mode)
+
+    result['invocation'] = dict(module_args=invocation_args(module.params))
+    for warning in result.pop('warnings', []):
+        module.warn(warning)
+    if result.pop('failed', False):
+        module.fail_json(**result)
+    module.exit_json(**result)
+
 
 if __name__ == '__main__':
     main()
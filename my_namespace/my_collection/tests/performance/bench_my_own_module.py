@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Бенчмарк my_own_module по размеру файлов, числу файлов и состояниям.
+
+Каждый сценарий выполняется в отдельном дочернем процессе, чтобы пиковая
+резидентная память (RSS) относилась только к нему. Модуль запускается
+внутри процесса через main(), время подготовки в замеры не входит.
+
+Сценарии:
+  size=<размер>/<состояние>  — один файл, содержимое из src на управляемом узле;
+  count=<число>/<состояние>  — пакет files из файлов по 1 КБ с content.
+
+Состояния: created (файла нет), unchanged (файл уже нужный), changed
+(изменён один байт), absent (удаление), check (changed в режиме проверки).
+
+Примеры:
+  python bench_my_own_module.py
+  python bench_my_own_module.py --full --save-baseline baseline.json
+  python bench_my_own_module.py --baseline baseline.json --tolerance 0.25
+
+Базовые замеры зависят от машины и диска, поэтому в репозитории их нет:
+их сохраняют на машине, где проверяется выпуск, и сравнивают там же.
+Код возврата 1 означает, что хотя бы один сценарий стал медленнее или
+потребовал больше памяти, чем допускает --tolerance.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import (  # noqa: E402
+    current_rss_kb, flip_byte, load_module, peak_rss_kb, percentile, run_module, write_file)
+
+SIZES = dict((label, size) for label, size in (
+    ('1K', 1 << 10), ('64K', 64 << 10), ('1M', 1 << 20), ('16M', 16 << 20),
+    ('256M', 256 << 20), ('1G', 1 << 30)))
+COUNTS = (1, 100, 1000, 10000, 100000)
+STATES = ('created', 'unchanged', 'changed', 'absent', 'check')
+# Без --full: сценарии, которые укладываются в пару минут
+QUICK_SIZES = ('1K', '64K', '1M', '16M')
+QUICK_COUNTS = (1, 100, 1000)
+ITEM_SIZE = 1024
+# Ожидаемое значение changed для каждого состояния
+EXPECT_CHANGED = dict(created=True, unchanged=False, changed=True, absent=True, check=True)
+
+
+def item_content(index, generation=0):
+    """Содержимое файла пакета размером ITEM_SIZE байт."""
+    head = f"{generation}:{index}\n"
+    return head + 'x' * (ITEM_SIZE - len(head) - 1) + '\n'
+
+
+class SizeScenario:
+    """Один файл размера size, содержимое передаётся через src."""
+
+    def __init__(self, workdir, size, state):
+        self.state = state
+        self.size = size
+        self.src = os.path.join(workdir, 'source.bin')
+        self.path = os.path.join(workdir, 'target.bin')
+        write_file(self.src, size)
+        if state in ('unchanged', 'changed', 'check'):
+            shutil.copyfile(self.src, self.path)
+
+    @property
+    def args(self):
+        if self.state == 'absent':
+            return dict(path=self.path, state='absent')
+        return dict(path=self.path, src=self.src)
+
+    def prepare(self):
+        if self.state == 'created' and os.path.exists(self.path):
+            os.unlink(self.path)
+        elif self.state in ('changed', 'check'):
+            flip_byte(self.path)
+        elif self.state == 'absent':
+            shutil.copyfile(self.src, self.path)
+
+    def units(self):
+        return self.size
+
+
+class CountScenario:
+    """Пакет из count файлов по ITEM_SIZE байт в одном вызове модуля."""
+
+    def __init__(self, workdir, count, state):
+        self.state = state
+        self.count = count
+        self.dir = os.path.join(workdir, 'files')
+        self.paths = [os.path.join(self.dir, f"f{i:06d}") for i in range(count)]
+        self.generation = 0
+        os.makedirs(self.dir)
+        if state != 'created':
+            self.write_all(self.generation)
+        if state == 'absent':
+            self.args = dict(files=[dict(path=path) for path in self.paths], state='absent')
+        else:
+            self.args = dict(files=[dict(path=path, content=item_content(i))
+                                    for i, path in enumerate(self.paths)])
+
+    def write_all(self, generation):
+        for i, path in enumerate(self.paths):
+            with open(path, 'w') as f:
+                f.write(item_content(i, generation))
+
+    def prepare(self):
+        if self.state == 'created':
+            shutil.rmtree(self.dir)
+            os.makedirs(self.dir)
+        elif self.state in ('changed', 'check'):
+            self.generation += 1
+            self.write_all(self.generation)
+        elif self.state == 'absent':
+            self.write_all(0)
+
+    def units(self):
+        return self.count
+
+
+def measure(module, scenario, repeat, parallelism):
+    """Выполняет сценарий repeat раз и возвращает замеры."""
+    samples = []
+    for _ in range(repeat):
+        scenario.prepare()
+        args = dict(scenario.args)
+        if parallelism > 1 and 'files' in args:
+            args['parallelism'] = parallelism
+        result, elapsed = run_module(module, args, check_mode=scenario.state == 'check')
+        if result.get('failed'):
+            raise RuntimeError(result.get('msg'))
+        if result.get('changed') != EXPECT_CHANGED[scenario.state]:
+            raise RuntimeError(f"changed={result.get('changed')} для состояния {scenario.state}")
+        samples.append(elapsed)
+    samples.sort()
+    p50 = percentile(samples, 0.5)
+    return dict(runs=len(samples),
+                p50_ms=p50 * 1000,
+                p95_ms=percentile(samples, 0.95) * 1000,
+                p99_ms=percentile(samples, 0.99) * 1000,
+                throughput=scenario.units() / p50 if p50 else 0.0)
+
+
+def run_isolated(module, name, make_scenario, repeat, parallelism, workdir):
+    """Выполняет сценарий в дочернем процессе и возвращает его замеры."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 0
+        try:
+            scenario_dir = tempfile.mkdtemp(prefix='scenario-', dir=workdir)
+            try:
+                start_rss = current_rss_kb()
+                stats = measure(module, make_scenario(scenario_dir), repeat, parallelism)
+                stats['peak_rss_kb'] = peak_rss_kb()
+                stats['rss_growth_kb'] = max(0, stats['peak_rss_kb'] - start_rss)
+            finally:
+                shutil.rmtree(scenario_dir, ignore_errors=True)
+        except Exception as e:
+            stats = dict(error=f"{type(e).__name__}: {e}")
+            status = 1
+        with os.fdopen(write_fd, 'w') as f:
+            json.dump(stats, f)
+        os._exit(status)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    stats = json.loads(data) if data else dict(error='процесс сценария завершился аварийно')
+    stats['scenario'] = name
+    return stats
+
+
+def format_throughput(name, value):
+    if name.startswith('size='):
+        return f"{value / (1 << 20):10.1f} MB/s"
+    return f"{value:10.0f} files/s"
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Возвращает список регрессий относительно базовых замеров."""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None or 'error' in stats or 'error' in base:
+            continue
+        if (stats['p50_ms'] > base['p50_ms'] * (1 + tolerance)
+                and stats['p50_ms'] - base['p50_ms'] > min_delta_ms):
+            regressions.append(f"{name}: p50 {base['p50_ms']:.1f} -> {stats['p50_ms']:.1f} мс")
+        if stats['rss_growth_kb'] > max(base['rss_growth_kb'], 1024) * (1 + tolerance):
+            regressions.append(f"{name}: прирост RSS {base['rss_growth_kb']} -> "
+                               f"{stats['rss_growth_kb']} КБ")
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Бенчмарк my_own_module")
+    parser.add_argument('--full', action='store_true',
+                        help="все размеры (до 1 ГБ) и числа файлов (до 100 000)")
+    parser.add_argument('--sizes', help="размеры через запятую, например 1K,1M")
+    parser.add_argument('--counts', help="числа файлов через запятую, например 1,1000")
+    parser.add_argument('--states', default=','.join(STATES),
+                        help="состояния через запятую")
+    parser.add_argument('--repeat', type=int, default=5, help="запусков на сценарий")
+    parser.add_argument('--parallelism', type=int, default=1,
+                        help="значение parallelism для пакетов files")
+    parser.add_argument('--workdir', help="каталог для файлов сценариев")
+    parser.add_argument('--json', help="сохранить замеры в файл")
+    parser.add_argument('--save-baseline', help="сохранить замеры как базовые")
+    parser.add_argument('--baseline', help="сравнить с базовыми замерами")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="допустимое ухудшение (доля), по умолчанию 0.25")
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help="меньшие изменения p50 считаются шумом")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    sizes = options.sizes.split(',') if options.sizes else (
+        list(SIZES) if options.full else list(QUICK_SIZES))
+    counts = [int(c) for c in options.counts.split(',')] if options.counts else (
+        list(COUNTS) if options.full else list(QUICK_COUNTS))
+    states = options.states.split(',')
+    for label in sizes:
+        if label not in SIZES:
+            sys.exit(f"Неизвестный размер {label}, допустимы: {', '.join(SIZES)}")
+    for state in states:
+        if state not in STATES:
+            sys.exit(f"Неизвестное состояние {state}, допустимы: {', '.join(STATES)}")
+
+    # Модуль импортируется до fork, чтобы импорт не входил в замеры
+    module = load_module()
+    workdir = tempfile.mkdtemp(prefix='my_collection-bench-', dir=options.workdir)
+    scenarios = []
+    for label in sizes:
+        for state in states:
+            scenarios.append((f"size={label}/{state}",
+                              lambda d, s=SIZES[label], st=state: SizeScenario(d, s, st)))
+    for count in counts:
+        for state in states:
+            scenarios.append((f"count={count}/{state}",
+                              lambda d, c=count, st=state: CountScenario(d, c, st)))
+
+    results = {}
+    print(f"{'сценарий':<28} {'p50 мс':>10} {'p95 мс':>10} {'p99 мс':>10} "
+          f"{'пропускная способность':>22} {'пик RSS МБ':>11}")
+    try:
+        for name, make_scenario in scenarios:
+            stats = run_isolated(module, name, make_scenario, options.repeat,
+                                 options.parallelism, workdir)
+            results[name] = stats
+            if 'error' in stats:
+                print(f"{name:<28} ошибка: {stats['error']}")
+                continue
+            print(f"{name:<28} {stats['p50_ms']:10.2f} {stats['p95_ms']:10.2f} "
+                  f"{stats['p99_ms']:10.2f} {format_throughput(name, stats['throughput']):>22} "
+                  f"{stats['peak_rss_kb'] / 1024:11.1f}")
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for path in (options.json, options.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    failed = any('error' in stats for stats in results.values())
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, options.tolerance, options.min_delta_ms)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Запуск my_own_module внутри текущего процесса для замеров производительности.
+
+Модуль импортируется из рабочей копии коллекции, main() вызывается
+с параметрами, подставленными так же, как это делает Ansible.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import atexit
+import contextlib
+import importlib
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+COLLECTION_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODULE_NAME = 'ansible_collections.my_namespace.my_collection.plugins.modules.my_own_module'
+
+
+def collection_path():
+    """Возвращает каталог для sys.path, из которого импортируется рабочая копия коллекции.
+
+    Если коллекция лежит вне дерева ansible_collections/<namespace>/<name>,
+    такое дерево создаётся во временном каталоге из символической ссылки.
+    """
+    namespace_dir = os.path.dirname(COLLECTION_ROOT)
+    if os.path.basename(os.path.dirname(namespace_dir)) == 'ansible_collections':
+        return os.path.dirname(os.path.dirname(namespace_dir))
+    base = tempfile.mkdtemp(prefix='my_collection-bench-')
+    atexit.register(shutil.rmtree, base, True)
+    os.makedirs(os.path.join(base, 'ansible_collections', 'my_namespace'))
+    os.symlink(COLLECTION_ROOT, os.path.join(base, 'ansible_collections', 'my_namespace',
+                                             'my_collection'))
+    return base
+
+
+def load_module():
+    """Импортирует my_own_module из рабочей копии коллекции."""
+    if MODULE_NAME not in sys.modules:
+        sys.path.insert(0, collection_path())
+    return importlib.import_module(MODULE_NAME)
+
+
+def set_module_args(args, check_mode=False):
+    """Подставляет параметры для следующего AnsibleModule так же, как Ansible."""
+    from ansible.module_utils import basic
+
+    args = dict(args, _ansible_check_mode=check_mode)
+    basic._ANSIBLE_ARGS = json.dumps(dict(ANSIBLE_MODULE_ARGS=args)).encode('utf-8')
+    if hasattr(basic, '_ANSIBLE_PROFILE'):
+        basic._ANSIBLE_PROFILE = 'legacy'
+
+
+def run_main(module):
+    """Вызывает main() модуля с параметрами, подставленными set_module_args.
+
+    Возвращает (результат, время выполнения в секундах). Результат — словарь,
+    который модуль вернул бы Ansible; при ошибке в нём есть failed.
+    """
+    from ansible.module_utils import basic
+
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            module.main()
+    except SystemExit:
+        pass
+    elapsed = time.perf_counter() - start
+    basic._ANSIBLE_ARGS = None
+    return json.loads(output.getvalue()), elapsed
+
+
+def run_module(module, args, check_mode=False):
+    """Вызывает main() модуля с параметрами args, см. run_main."""
+    set_module_args(args, check_mode)
+    return run_main(module)
+
+
+def current_rss_kb(field='VmRSS'):
+    """Текущий размер резидентной памяти процесса в КБ (0, если неизвестен).
+
+    field=RssAnon учитывает только анонимную память, без отображённых файлов.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def peak_rss_kb():
+    """Наибольший размер резидентной памяти процесса в КБ."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS возвращает байты, Linux — килобайты
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(values, fraction):
+    """Процентиль отсортированного списка с линейной интерполяцией."""
+    if not values:
+        return 0.0
+    pos = (len(values) - 1) * fraction
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def write_file(path, size):
+    """Создаёт файл заданного размера с плохо сжимаемым содержимым."""
+    # Повтор через 64 КБ длиннее окна zlib, поэтому данные почти не сжимаются
+    chunk = os.urandom(64 * 1024)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            part = chunk[:min(remaining, len(chunk))]
+            f.write(part)
+            remaining -= len(part)
+
+
+def flip_byte(path):
+    """Меняет средний байт файла, не меняя размер."""
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.seek(size // 2)
+        value = f.read(1)
+        f.seek(size // 2)
+        f.write(bytes([(value[0] + 1) % 256]) if value else b'x')
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Проверка того, что пиковая память my_own_module не растёт с размером файла.
+
+Модуль выполняется внутри процесса на синтетических файлах разного размера
+под tracemalloc, параллельно поток замеряет анонимную резидентную память
+(RssAnon: отображённые в память файлы в неё не входят). Каждый сценарий
+выполняется в отдельном дочернем процессе.
+
+Пределы относятся к работе модуля: замер начинается при входе в run(), когда
+AnsibleModule уже разобрал параметры. Пик разбора параметров зависит от
+версии ansible-core и выводится отдельно, без проверки.
+
+Сценарии: <источник>=<размер>/<состояние>.
+  src     — содержимое читается из файла на узле, поэтому всё, что сверх
+            фиксированного предела, означает чтение файла целиком;
+  content — содержимое приходит в параметрах строкой, и для записи нужно
+            её байтовое представление, поэтому из прироста вычитается
+            CONTENT_COPIES * размер, а пределу подчиняется остаток.
+Состояния: created (файла нет), unchanged (файл уже нужный),
+changed (изменён один байт).
+
+Примеры:
+  python memory_my_own_module.py
+  python memory_my_own_module.py --sizes 1M,256M --max-peak-mb 8
+
+Код возврата 1 означает, что хотя бы один сценарий превысил предел.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import base64
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import (  # noqa: E402
+    current_rss_kb, flip_byte, load_module, run_main, set_module_args, write_file)
+
+SIZES = dict((label, size) for label, size in (
+    ('1M', 1 << 20), ('16M', 16 << 20), ('64M', 64 << 20), ('256M', 256 << 20),
+    ('1G', 1 << 30)))
+DEFAULT_SIZES = ('1M', '16M', '64M')
+SOURCES = ('src', 'content')
+STATES = ('created', 'unchanged', 'changed')
+# Копии content, которые модуль создаёт по необходимости: bytes для записи
+CONTENT_COPIES = 1
+DEFAULT_MAX_PEAK_MB = 8
+DEFAULT_MAX_RSS_MB = 16
+SAMPLE_INTERVAL = 0.005
+
+
+class RssSampler(threading.Thread):
+    """Фоновый поток, запоминающий наибольшую анонимную RSS процесса."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stop_event = threading.Event()
+        self.base = current_rss_kb('RssAnon')
+        self.peak = self.base
+
+    def rebase(self):
+        """Начинает замер заново от текущего значения."""
+        self.base = self.peak = current_rss_kb('RssAnon')
+
+    def run(self):
+        while not self.stop_event.wait(SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss_kb('RssAnon'))
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.peak = max(self.peak, current_rss_kb('RssAnon'))
+        return self.peak - self.base
+
+
+def prepare(workdir, source, size, state):
+    """Создаёт файлы сценария и возвращает параметры модуля."""
+    src = os.path.join(workdir, 'source.bin')
+    path = os.path.join(workdir, 'target.bin')
+    if source == 'src':
+        write_file(src, size)
+    else:
+        # Содержимое в ASCII: размер в символах и в байтах UTF-8 совпадает
+        chunk = base64.b64encode(os.urandom(48 * 1024))
+        with open(src, 'wb') as f:
+            for offset in range(0, size, len(chunk)):
+                f.write(chunk[:min(len(chunk), size - offset)])
+    if state != 'created':
+        shutil.copyfile(src, path)
+    if state == 'changed':
+        flip_byte(path)
+    if source == 'src':
+        return dict(path=path, src=src)
+    with open(src, 'r') as f:
+        content = f.read()
+    return dict(path=path, content=content)
+
+
+def measure(module, workdir, source, size, state):
+    """Выполняет сценарий и возвращает пики tracemalloc и прирост RSS в байтах."""
+    args = prepare(workdir, source, size, state)
+    # Сериализация параметров — работа Ansible, а не модуля, поэтому до замеров
+    set_module_args(args)
+    sampler = RssSampler()
+    marks = {}
+    module_run = module.run
+
+    def traced_run(*run_args, **run_kwargs):
+        # Всё, что выше текущего объёма при входе в run(), выделил модуль
+        marks['startup_peak'] = tracemalloc.get_traced_memory()[1]
+        marks['entry'] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        sampler.rebase()
+        return module_run(*run_args, **run_kwargs)
+
+    module.run = traced_run
+    sampler.start()
+    tracemalloc.start()
+    try:
+        result, elapsed = run_main(module)
+        peak = tracemalloc.get_traced_memory()[1] - marks['entry']
+    finally:
+        tracemalloc.stop()
+        rss_growth = sampler.stop() * 1024
+        module.run = module_run
+    if result.get('failed'):
+        raise RuntimeError(result.get('msg'))
+    if result.get('changed') != (state != 'unchanged'):
+        raise RuntimeError(f"changed={result.get('changed')} для состояния {state}")
+    inherent = 0
+    if source == 'content':
+        inherent = CONTENT_COPIES * size
+    return dict(peak=peak, rss_growth=rss_growth, inherent=inherent,
+                startup_peak=marks['startup_peak'], seconds=elapsed)
+
+
+def run_isolated(module, source, size, state, workdir):
+    """Выполняет сценарий в дочернем процессе и возвращает его замеры."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 0
+        scenario_dir = tempfile.mkdtemp(prefix='scenario-', dir=workdir)
+        try:
+            stats = measure(module, scenario_dir, source, size, state)
+        except Exception as e:
+            stats = dict(error=f"{type(e).__name__}: {e}")
+            status = 1
+        finally:
+            shutil.rmtree(scenario_dir, ignore_errors=True)
+        with os.fdopen(write_fd, 'w') as f:
+            json.dump(stats, f)
+        os._exit(status)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data) if data else dict(error='процесс сценария завершился аварийно')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Проверка пиковой памяти my_own_module")
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help=f"размеры через запятую из {', '.join(SIZES)}")
+    parser.add_argument('--sources', default=','.join(SOURCES),
+                        help="источники содержимого через запятую")
+    parser.add_argument('--states', default=','.join(STATES),
+                        help="состояния через запятую")
+    parser.add_argument('--max-peak-mb', type=float, default=DEFAULT_MAX_PEAK_MB,
+                        help="предел пика tracemalloc на файл сверх неизбежных копий content")
+    parser.add_argument('--max-rss-mb', type=float, default=DEFAULT_MAX_RSS_MB,
+                        help="предел прироста анонимной RSS на файл сверх копий content")
+    parser.add_argument('--workdir', help="каталог для файлов сценариев")
+    parser.add_argument('--json', help="сохранить замеры в файл")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    sizes = options.sizes.split(',')
+    for label in sizes:
+        if label not in SIZES:
+            sys.exit(f"Неизвестный размер {label}, допустимы: {', '.join(SIZES)}")
+    max_peak = options.max_peak_mb * (1 << 20)
+    max_rss = options.max_rss_mb * (1 << 20)
+
+    module = load_module()
+    workdir = tempfile.mkdtemp(prefix='my_collection-memory-', dir=options.workdir)
+    results = {}
+    failures = []
+    print(f"{'сценарий':<26} {'пик модуля МБ':>14} {'прирост RSS МБ':>15} "
+          f"{'сверх копий МБ':>15} {'разбор параметров МБ':>21}")
+    try:
+        for source in options.sources.split(','):
+            for label in sizes:
+                for state in options.states.split(','):
+                    name = f"{source}={label}/{state}"
+                    stats = run_isolated(module, source, SIZES[label], state, workdir)
+                    results[name] = stats
+                    if 'error' in stats:
+                        print(f"{name:<26} ошибка: {stats['error']}")
+                        failures.append(f"{name}: {stats['error']}")
+                        continue
+                    excess = stats['peak'] - stats['inherent']
+                    print(f"{name:<26} {stats['peak'] / (1 << 20):14.1f} "
+                          f"{stats['rss_growth'] / (1 << 20):15.1f} {excess / (1 << 20):15.1f} "
+                          f"{stats['startup_peak'] / (1 << 20):21.1f}")
+                    sys.stdout.flush()
+                    if excess > max_peak:
+                        failures.append(f"{name}: пик {excess / (1 << 20):.1f} МБ "
+                                        f"> {options.max_peak_mb} МБ")
+                    if stats['rss_growth'] - stats['inherent'] > max_rss:
+                        failures.append(f"{name}: прирост RSS "
+                                        f"{(stats['rss_growth'] - stats['inherent']) / (1 << 20):.1f}"
+                                        f" МБ > {options.max_rss_mb} МБ")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    for line in failures:
+        print(f"ПРЕВЫШЕНИЕ {line}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
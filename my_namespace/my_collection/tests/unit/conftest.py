@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+"""Делает рабочую копию коллекции импортируемой как ansible_collections.my_namespace.my_collection.
+
+ansible-test units делает это сам; при запуске pytest напрямую коллекция
+может лежать вне дерева ansible_collections/<namespace>/<name>, тогда такое
+дерево создаётся во временном каталоге из символической ссылки.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+COLLECTION_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def collection_path():
+    namespace_dir = os.path.dirname(COLLECTION_ROOT)
+    if os.path.basename(os.path.dirname(namespace_dir)) == 'ansible_collections':
+        return os.path.dirname(os.path.dirname(namespace_dir))
+    base = tempfile.mkdtemp(prefix='my_collection-units-')
+    atexit.register(shutil.rmtree, base, True)
+    os.makedirs(os.path.join(base, 'ansible_collections', 'my_namespace'))
+    os.symlink(COLLECTION_ROOT, os.path.join(base, 'ansible_collections', 'my_namespace',
+                                             'my_collection'))
+    return base
+
+
+try:
+    import ansible_collections.my_namespace.my_collection  # noqa: F401
+except ImportError:
+    sys.path.insert(0, collection_path())
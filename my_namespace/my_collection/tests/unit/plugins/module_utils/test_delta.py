@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import os
+import random
+
+import pytest
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.atomic import (
+    atomic_write_chunks)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.delta import (
+    MAX_UNMATCHED_WINDOWS, MIN_BLOCK_SIZE, apply_delta, block_signatures, compute_delta,
+    delta_stats)
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.my_utils import (
+    calculate_checksum)
+
+BLOCK_SIZE = MIN_BLOCK_SIZE
+
+
+def random_bytes(size, seed):
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, 'little')
+
+
+@pytest.fixture
+def basis(tmp_path):
+    """Существующий файл из 128 блоков и его содержимое."""
+    path = str(tmp_path / 'basis')
+    data = random_bytes(128 * BLOCK_SIZE, 1)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path, data
+
+
+def round_trip(path, source, max_literal=None):
+    """Строит дельту от файла path к source и восстанавливает по ней содержимое."""
+    signatures = block_signatures(path, BLOCK_SIZE)
+    ops = compute_delta(source, signatures, max_literal)
+    assert ops is not None
+    assert b''.join(apply_delta(path, ops, BLOCK_SIZE)) == source
+    return ops
+
+
+@pytest.mark.parametrize('name, change', [
+    ('unchanged', lambda data: data),
+    ('insertion', lambda data: data[:5000] + b'inserted bytes' + data[5000:]),
+    ('deletion', lambda data: data[:5000] + data[5000 + 3 * BLOCK_SIZE + 7:]),
+    ('replacement', lambda data: data[:40000] + b'x' * 1000 + data[41000:]),
+    ('append', lambda data: data + b'tail'),
+    ('truncation', lambda data: data[:len(data) // 2 + 123]),
+    ('moved blocks', lambda data: data[len(data) // 2:] + data[:len(data) // 2]),
+])
+def test_round_trip(basis, name, change):
+    path, data = basis
+    source = change(data)
+
+    ops = round_trip(path, source)
+
+    # Почти всё содержимое берётся из существующего файла
+    reused = delta_stats(ops, BLOCK_SIZE)
+    assert reused >= min(len(source), len(data)) - 6 * BLOCK_SIZE
+
+
+def test_source_shorter_than_block(basis):
+    path, _ = basis
+    ops = round_trip(path, b'short')
+    assert ops == [['d', ops[0][1]]]
+
+
+def test_unrelated_data_is_rejected_early(basis):
+    path, _ = basis
+    signatures = block_signatures(path, BLOCK_SIZE)
+    source = random_bytes((MAX_UNMATCHED_WINDOWS + 64) * BLOCK_SIZE, 2)
+
+    assert compute_delta(source, signatures) is None
+
+
+def test_new_data_after_matches_is_kept(basis):
+    path, data = basis
+    # Новых данных больше MAX_UNMATCHED_WINDOWS блоков, но меньше уже совпавших
+    source = data + random_bytes((MAX_UNMATCHED_WINDOWS + 16) * BLOCK_SIZE, 3)
+
+    ops = round_trip(path, source)
+
+    assert delta_stats(ops, BLOCK_SIZE) == len(data)
+
+
+def test_max_literal(basis):
+    path, data = basis
+    signatures = block_signatures(path, BLOCK_SIZE)
+    extra = random_bytes(10000, 4)
+    source = data[:20000] + extra + data[20000:]
+
+    assert compute_delta(source, signatures, max_literal=len(extra) // 2) is None
+    round_trip(path, source, max_literal=len(extra) + 2 * BLOCK_SIZE)
+
+
+def test_truncated_basis_is_detected(basis):
+    path, data = basis
+    signatures = block_signatures(path, BLOCK_SIZE)
+    ops = compute_delta(data + b'tail', signatures)
+    # Файл изменился между подписью и применением дельты
+    with open(path, 'r+b') as f:
+        f.truncate(len(data) // 2)
+
+    with pytest.raises(ValueError):
+        b''.join(apply_delta(path, ops, BLOCK_SIZE))
+
+
+def test_checksum_mismatch_leaves_target_unchanged(basis):
+    path, data = basis
+    signatures = block_signatures(path, BLOCK_SIZE)
+    source = data[:1000] + b'changed' + data[1000:]
+    ops = compute_delta(source, signatures)
+    # Дельта построена не для того содержимого, которое ожидается
+    expected = calculate_checksum(source + b'other', 'sha1')
+
+    with pytest.raises(ValueError):
+        atomic_write_chunks(path, apply_delta(path, ops, BLOCK_SIZE), algorithm='sha1',
+                            expected=expected)
+
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    assert os.listdir(os.path.dirname(path)) == ['basis']
+
+
+def test_checksum_match_replaces_target(basis):
+    path, data = basis
+    signatures = block_signatures(path, BLOCK_SIZE)
+    source = data[:1000] + b'changed' + data[1000:]
+    ops = compute_delta(source, signatures)
+
+    atomic_write_chunks(path, apply_delta(path, ops, BLOCK_SIZE), algorithm='sha1',
+                        expected=calculate_checksum(source, 'sha1'))
+
+    with open(path, 'rb') as f:
+        assert f.read() == source
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+
+import pytest
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.manifest import (
+    load_manifest)
+
+
+def write_manifest(tmp_path, data):
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+def entry(**fields):
+    return dict(dict(path='/srv/app/a.conf', checksum='0' * 40), **fields)
+
+
+@pytest.mark.parametrize('mode, expected', [
+    ('0644', 0o644),
+    ('600', 0o600),
+    (420, 0o644),
+    (None, None),
+    ('', None),
+])
+def test_mode_is_normalized(tmp_path, mode, expected):
+    entries = load_manifest(write_manifest(tmp_path, [entry(mode=mode)]))
+    assert entries[0]['mode'] == expected
+
+
+@pytest.mark.parametrize('fields, message', [
+    (dict(mode='u+rw'), 'Недопустимые права'),
+    (dict(mode='0899'), 'Недопустимые права'),
+    (dict(mode=True), 'Недопустимые права'),
+    (dict(mode=0o17777), 'вне диапазона'),
+    (dict(owner=0), 'owner'),
+    (dict(group=['wheel']), 'group'),
+    (dict(size='12'), 'size'),
+    (dict(size=-1), 'size'),
+    (dict(checksum=123), 'checksum'),
+])
+def test_invalid_fields_are_rejected(tmp_path, fields, message):
+    with pytest.raises(ValueError, match=message):
+        load_manifest(write_manifest(tmp_path, [entry(**fields)]))
+
+
+def test_relative_paths_use_root(tmp_path):
+    entries = load_manifest(write_manifest(tmp_path, dict(root='/srv/app', files=[
+        dict(path='conf/../a.conf', checksum='1' * 40, owner='root', size=0),
+        dict(path='/etc/b.conf', state='absent'),
+    ])))
+
+    assert [e['path'] for e in entries] == ['/srv/app/a.conf', '/etc/b.conf']
+    assert entries[0]['owner'] == 'root' and entries[0]['size'] == 0
+    assert entries[1]['mode'] is None and entries[1]['group'] is None
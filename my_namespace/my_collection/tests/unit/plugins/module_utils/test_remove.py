@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import os
+
+import pytest
+
+from ansible_collections.my_namespace.my_collection.plugins.module_utils.remove import (
+    remove_paths)
+
+
+def make_files(root, files):
+    """Создаёт файлы {относительный путь: содержимое} вместе с каталогами."""
+    for name, content in files.items():
+        path = os.path.join(str(root), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+def existing(root):
+    """Возвращает отсортированные относительные пути всех файлов и каталогов под root."""
+    found = []
+    for dir_path, dir_names, file_names in os.walk(str(root)):
+        for name in dir_names + file_names:
+            found.append(os.path.relpath(os.path.join(dir_path, name), str(root)))
+    return sorted(found)
+
+
+def test_literal_path_is_not_a_pattern(tmp_path):
+    make_files(tmp_path, {'a[bc]': 'x', 'ab': 'y', 'ac': 'z'})
+    pattern = str(tmp_path / 'a[bc]')
+
+    assert remove_paths(pattern)['removed_files'] == 1
+    # Повторный запуск не должен удалить ab и ac, совпадающие с путём как с шаблоном
+    assert remove_paths(pattern)['removed_files'] == 0
+    assert existing(tmp_path) == ['ab', 'ac']
+
+
+def test_glob_removes_matches(tmp_path):
+    make_files(tmp_path, {'a.log': '12', 'b.log': '345', 'c.txt': '6'})
+
+    totals = remove_paths(str(tmp_path / '*.log'), use_glob=True)
+
+    assert totals == dict(removed_files=2, removed_dirs=0, freed_bytes=5)
+    assert existing(tmp_path) == ['c.txt']
+
+
+def test_recursive_glob(tmp_path):
+    make_files(tmp_path, {'app.log': '1', 'app.log.1': '22', 'sub/app.log.2': '333',
+                          'sub/deeper/app.log.3': '4444'})
+
+    totals = remove_paths(str(tmp_path / '**' / '*.log.[0-9]*'), use_glob=True)
+
+    assert totals == dict(removed_files=3, removed_dirs=0, freed_bytes=9)
+    assert existing(tmp_path) == ['app.log', 'sub', 'sub/deeper']
+
+
+def test_directory_match_without_recurse_removes_nothing(tmp_path):
+    make_files(tmp_path, {'a.log': '1', 'b.log': '2', 'b_dir.log/inner': '3'})
+
+    with pytest.raises(IsADirectoryError):
+        remove_paths(str(tmp_path / '*.log'), use_glob=True)
+
+    assert existing(tmp_path) == ['a.log', 'b.log', 'b_dir.log', 'b_dir.log/inner']
+
+
+def test_recurse_removes_tree(tmp_path):
+    make_files(tmp_path, {'cache/1/a': '12', 'cache/1/b': '3', 'cache/2/c': '456', 'keep': '7'})
+
+    totals = remove_paths(str(tmp_path / 'cache'), recurse=True, parallelism=4)
+
+    assert totals == dict(removed_files=3, removed_dirs=3, freed_bytes=6)
+    assert existing(tmp_path) == ['keep']
+
+
+def test_recurse_does_not_follow_symlinks(tmp_path):
+    make_files(tmp_path, {'cache/a': '1', 'outside/b': '22'})
+    os.symlink(str(tmp_path / 'outside'), str(tmp_path / 'cache' / 'link'))
+
+    totals = remove_paths(str(tmp_path / 'cache'), recurse=True)
+
+    assert totals['removed_files'] == 2
+    assert existing(tmp_path) == ['outside', 'outside/b']
+
+
+def test_glob_with_recurse_counts_nested_matches_once(tmp_path):
+    make_files(tmp_path, {'tmp/x': '1', 'tmp/y/z': '22'})
+
+    totals = remove_paths(str(tmp_path / '**'), recurse=True, use_glob=True)
+
+    assert totals == dict(removed_files=2, removed_dirs=3, freed_bytes=3)
+    assert not os.path.exists(str(tmp_path))
+
+
+@pytest.mark.parametrize('pattern, recurse, use_glob', [
+    ('cache', True, False),
+    ('*.log', False, True),
+    ('**', True, True),
+])
+def test_check_mode_counts_match_real_run(tmp_path, pattern, recurse, use_glob):
+    make_files(tmp_path, {'cache/1/a': '12', 'cache/b': '3', 'a.log': '456', 'b.log': '7'})
+    before = existing(tmp_path)
+
+    planned = remove_paths(str(tmp_path / pattern), recurse, check_mode=True, use_glob=use_glob)
+    assert existing(tmp_path) == before
+
+    assert remove_paths(str(tmp_path / pattern), recurse, use_glob=use_glob) == planned